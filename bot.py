@@ -1,22 +1,35 @@
+import hashlib
 import logging
 import os
-from textwrap import dedent
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
-import redis
-import telegram
 from dotenv import load_dotenv
 from more_itertools import chunked
-from telegram import InlineKeyboardMarkup, LabeledPrice
-from telegram.ext import CallbackQueryHandler, CommandHandler, MessageHandler, PreCheckoutQueryHandler
+import telegram
+from telegram import InlineKeyboardMarkup, InlineQueryResultArticle, InputMediaPhoto, InputTextMessageContent, \
+    LabeledPrice
+from telegram.error import BadRequest
+from telegram.ext import CallbackQueryHandler, CommandHandler, InlineQueryHandler, MessageHandler, \
+    PreCheckoutQueryHandler
 from telegram.ext import Filters, Updater
+from telegram.utils.request import Request
 
+import cart
+from database import get_chat_store_key, get_database_connection, get_message_fingerprint_key
+import delivery_quotes
 import online_shop
+import search
+import templates
+import tracing
 from keyboards import get_products_keyboard, get_purchase_options_keyboard, get_cart_button, get_menu_button, \
-    get_text_and_buttons_for_cart, get_pagination_buttons, get_delivery_buttons, get_payment_button
-from utils import fetch_coordinates, get_nearest_pizzeria, get_delivery_cost_and_message_text, save_customer_address
+    get_cart_keyboard, get_pagination_buttons, get_delivery_buttons, get_payment_button, \
+    get_search_button
+from utils import fetch_coordinates, save_customer_address
 
-_database = None
 logger = logging.getLogger(__name__)
+MESSAGE_FINGERPRINT_EXPIRATION_TIME = 24 * 60 * 60
+UPDATER_WORKERS_NUMBER = 4
 
 
 def start(update, context):
@@ -43,20 +56,15 @@ def start(update, context):
     keyboard = get_products_keyboard(product_pages[page_number - 1])
     pagination_buttons = get_pagination_buttons(next_page_number, page_number, pages_count, previous_page_number)
     keyboard.append(pagination_buttons)
-    keyboard.append([get_cart_button()])
+    keyboard.append([get_search_button(), get_cart_button()])
     reply_markup = InlineKeyboardMarkup(keyboard)
 
     menu_text = 'Пожалуйста, выберите товар:'
     if update.message:
-        update.message.reply_text(text=menu_text, reply_markup=reply_markup)
+        message = update.message.reply_text(text=menu_text, reply_markup=reply_markup)
+        remember_message(message, menu_text, reply_markup)
     elif update.callback_query:
-        message = update.callback_query.message
-        if len(message.photo) == 0:
-            context.bot.edit_message_text(chat_id=message.chat.id, message_id=message.message_id, text=menu_text,
-                                          reply_markup=reply_markup)
-        else:
-            context.bot.delete_message(chat_id=message.chat.id, message_id=message.message_id)
-            message.reply_text(text=menu_text, reply_markup=reply_markup)
+        show_text(context, update.callback_query.message, menu_text, reply_markup)
     logger.info('Выведен список товаров')
     return 'HANDLE_MENU'
 
@@ -64,7 +72,8 @@ def start(update, context):
 def handle_menu(update, context):
     """Хэндлер для состояния HANDLE_MENU.
 
-    Выводит карточку товара из нажатой в меню кнопки, обрабатывает пагинацию, либо переходит в корзину или в меню.
+    Выводит карточку товара из нажатой в меню кнопки или найденного в inline-поиске,
+    обрабатывает пагинацию, либо переходит в корзину или в меню.
 
     Args:
         update (:class:`telegram.Update`): Incoming telegram update.
@@ -74,7 +83,7 @@ def handle_menu(update, context):
         str: одно из состояний: HANDLE_MENU, HANDLE_CART_EDIT, HANDLE_DESCRIPTION
     """
     if update.message:
-        return 'HANDLE_MENU'
+        return show_found_product(update, context) or 'HANDLE_MENU'
     if update.callback_query:
         query = update.callback_query
         if query.data == 'cart':
@@ -92,32 +101,74 @@ def handle_menu(update, context):
 
         logger.info(f'Выбран товар с id {query.data}')
         product = online_shop.get_product(query.data)
-
-        keyboard = get_purchase_options_keyboard(product)
-        keyboard.append([get_cart_button(), get_menu_button()])
-        reply_markup = InlineKeyboardMarkup(keyboard)
-
-        product_price = product['meta']['display_price']['with_tax']
-        text = f"""\
-        {product['name']}
-        {product_price['formatted']}
-        
-        {product['description']}
-        """
-        try:
-            image_id = product['relationships']['main_image']['data']['id']
-            image_url = online_shop.get_file_href(image_id)
-            context.bot.delete_message(chat_id=query.message.chat.id, message_id=query.message.message_id)
-            context.bot.send_photo(chat_id=query.message.chat_id, photo=image_url, caption=dedent(text),
-                                   reply_markup=reply_markup)
-        except KeyError:
-            context.bot.edit_message_text(text=dedent(text), chat_id=query.message.chat_id,
-                                          message_id=query.message.message_id,
-                                          reply_markup=reply_markup)
+        text, reply_markup = get_product_card(product)
+        if product.image_id:
+            show_photo(context, query.message, online_shop.get_file_href(product.image_id), text, reply_markup)
+        else:
+            show_text(context, query.message, text, reply_markup)
         logger.info(f'Выведен товар с id {query.data}')
         return 'HANDLE_DESCRIPTION'
 
 
+def get_product_card(product):
+    keyboard = get_purchase_options_keyboard(product)
+    keyboard.append([get_cart_button(), get_menu_button()])
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    return templates.render_product_card(product), reply_markup
+
+
+def show_found_product(update, context):
+    """Выводит карточку товара, выбранного в inline-поиске.
+
+    Выбранный результат поиска приходит сообщением с названием товара, отправленным через этого бота.
+
+    Args:
+        update (:class:`telegram.Update`): Incoming telegram update.
+        context (:class:`telegram.ext.CallbackContext`): The context object passed to the callback.
+
+    Returns:
+        str: состояние HANDLE_DESCRIPTION или None, если сообщение не результат поиска
+    """
+    message = update.message
+    if not message.via_bot or message.via_bot.id != context.bot.id:
+        return
+    product = search.get_product_index(online_shop.get_all_products()).get_by_name(message.text)
+    if not product:
+        return
+
+    logger.info(f'Выбран найденный товар с id {product.id}')
+    text, reply_markup = get_product_card(product)
+    if product.image_id:
+        image_url = online_shop.get_file_href(product.image_id)
+        context.bot.send_photo(chat_id=message.chat_id, photo=image_url, caption=text, reply_markup=reply_markup)
+    else:
+        message.reply_text(text=text, reply_markup=reply_markup)
+    return 'HANDLE_DESCRIPTION'
+
+
+def handle_inline_query(update, context):
+    """Хэндлер inline-поиска товаров по названию и описанию.
+
+    Args:
+        update (:class:`telegram.Update`): Incoming telegram update.
+        context (:class:`telegram.ext.CallbackContext`): The context object passed to the callback.
+    """
+    query = update.inline_query
+    with online_shop.use_store(get_chat_store_name(context, query.from_user.id)):
+        products = search.get_product_index(online_shop.get_all_products()).search(query.query)
+    results = [
+        InlineQueryResultArticle(
+            id=product.id,
+            title=product.name,
+            description=f'{templates.format_price(product.price)} {product.description}',
+            input_message_content=InputTextMessageContent(product.name)
+        )
+        for product in products
+    ]
+    # Чаты привязаны к разным магазинам, поэтому Telegram не должен отдавать кэш одного пользователя другому
+    query.answer(results, cache_time=300, is_personal=True)
+
+
 def handle_description(update, context):
     """Хэндлер для состояния HANDLE_DESCRIPTION.
 
@@ -134,7 +185,7 @@ def handle_description(update, context):
         str: одно из состояний: HANDLE_CART_EDIT, HANDLE_MENU, HANDLE_DESCRIPTION
     """
     if update.message:
-        return 'HANDLE_DESCRIPTION'
+        return show_found_product(update, context) or 'HANDLE_DESCRIPTION'
     if update.callback_query:
         query = update.callback_query
         if query.data == 'cart':
@@ -144,7 +195,7 @@ def handle_description(update, context):
 
         product_id, quantity = query.data.split(',')
         logger.info(f'Добавляем товар с id {product_id} в количестве {quantity} корзину {query.message.chat.id}')
-        online_shop.add_product_to_cart(query.message.chat.id, product_id, int(quantity))
+        cart.add_product(get_database_connection(), query.message.chat.id, product_id, int(quantity))
         query.answer('Товар добавлен в корзину')
         return 'HANDLE_DESCRIPTION'
 
@@ -163,28 +214,19 @@ def handle_cart(update, context):
     """
     query = update.callback_query
     logger.info(f'Выводим корзину {query.message.chat.id}')
-    products = online_shop.get_cart_items(query.message.chat.id)
+    customer_cart = cart.get_cart(get_database_connection(), query.message.chat.id)
+    if cart.pop_lost_changes(get_database_connection(), query.message.chat.id):
+        query.answer(templates.CART_CHANGES_LOST_TEXT, show_alert=True)
 
-    keyboard, text = get_text_and_buttons_for_cart(products)
+    keyboard = get_cart_keyboard(customer_cart.items)
     keyboard.append([get_menu_button()])
     keyboard.append([get_payment_button()])
     reply_markup = InlineKeyboardMarkup(keyboard)
 
-    cart = online_shop.get_cart(query.message.chat.id)
-    total = cart['data']['meta']['display_price']['with_tax']['formatted']
-    cart_text = f'''\
-    {text}
-        К оплате: {total}
-    '''
-    aligned_cart_text = dedent(cart_text)
-    if len(query.message.photo) == 0:
-        context.bot.edit_message_text(chat_id=query.message.chat.id, message_id=query.message.message_id,
-                                      text=aligned_cart_text, reply_markup=reply_markup)
-    else:
-        context.bot.delete_message(chat_id=query.message.chat.id, message_id=query.message.message_id)
-        update.callback_query.message.reply_text(text=aligned_cart_text, reply_markup=reply_markup)
+    cart_text = templates.render_cart(customer_cart)
+    show_text(context, query.message, cart_text, reply_markup)
 
-    context.chat_data['cart_text'] = aligned_cart_text
+    context.chat_data['cart_text'] = cart_text
 
     return 'HANDLE_CART_EDIT'
 
@@ -213,7 +255,7 @@ def handle_cart_edit(update, context):
             return 'HANDLE_LOCATION'
 
         logger.info(f'Удаляем из корзины {query.message.chat.id} товар с id {query.data}')
-        online_shop.remove_product_from_cart(query.message.chat.id, query.data)
+        cart.remove_product(get_database_connection(), query.message.chat.id, query.data)
         handle_cart(update, context)
         return 'HANDLE_CART_EDIT'
 
@@ -245,13 +287,13 @@ def handle_location(update, context):
                 message.reply_text(text='Не удалось распознать адрес. Попробуйте ввести еще раз')
                 return 'HANDLE_LOCATION'
 
-        pizzerias = online_shop.get_all_entries(context.bot_data['pizzerias_flow_name'])
-        nearest_pizzeria = get_nearest_pizzeria(current_position, pizzerias)
-        delivery_cost, message_text = get_delivery_cost_and_message_text(nearest_pizzeria)
+        pizzerias = online_shop.get_pizzerias(context.bot_data['pizzerias_flow_name'])
+        nearest_pizzeria, delivery_cost, message_text = delivery_quotes.get_delivery_quote(
+            get_database_connection(), current_position, pizzerias)
 
         keyboard = get_delivery_buttons()
         reply_markup = InlineKeyboardMarkup(keyboard)
-        update.message.reply_text(text=dedent(message_text), reply_markup=reply_markup)
+        update.message.reply_text(text=message_text, reply_markup=reply_markup)
 
         address_id = save_customer_address(message.chat_id, current_position)
 
@@ -282,15 +324,15 @@ def handle_new_order(update, context):
         query = update.callback_query
         nearest_pizzeria = context.chat_data['nearest_pizzeria']
         if query.data == 'delivery':
-            customer_address = online_shop.get_entry('Customer_Address', context.chat_data['address_id'])
-            deliver_telegram_id = nearest_pizzeria['pizzeria']['Deliver_telegram_id']
+            customer_address = online_shop.get_customer_address(context.chat_data['address_id'])
+            deliver_telegram_id = nearest_pizzeria.deliver_telegram_id
 
             query.bot.send_message(chat_id=deliver_telegram_id, text=context.chat_data['cart_text'])
             delivery_cost = context.chat_data.setdefault('delivery_cost', 0)
             if delivery_cost > 0:
                 query.bot.send_message(chat_id=deliver_telegram_id, text=f'Стоимость доставки {delivery_cost}')
-            query.bot.send_location(chat_id=deliver_telegram_id, latitude=customer_address['Latitude'],
-                                    longitude=customer_address['Longitude'])
+            query.bot.send_location(chat_id=deliver_telegram_id, latitude=customer_address.latitude,
+                                    longitude=customer_address.longitude)
 
             context.job_queue.run_once(get_feedback, 30, context=query.message.chat_id)
 
@@ -301,7 +343,7 @@ def handle_new_order(update, context):
             return 'HANDLE_WAITING_PAYMENT'
 
         elif query.data == 'pick-up':
-            query.message.reply_text(text=f'Адрес ближайшей пиццерии {nearest_pizzeria["pizzeria"]["Address"]}')
+            query.message.reply_text(text=f'Адрес ближайшей пиццерии {nearest_pizzeria.address}')
 
     return 'HANDLE_FINISH'
 
@@ -320,10 +362,9 @@ def start_payment(update, context):
         start_parameter = 'test-payment'
         currency = context.bot_data['currency']
         prices = []
-        products = online_shop.get_cart_items(query.message.chat.id)
-        for product in products:
-            product_price = product['meta']['display_price']['with_tax']
-            prices.append(LabeledPrice(product['name'], product_price['value']['amount']))
+        customer_cart = cart.get_cart(get_database_connection(), query.message.chat.id)
+        for cart_item in customer_cart.items:
+            prices.append(LabeledPrice(cart_item.name, cart_item.value))
         delivery_cost = context.chat_data.setdefault('delivery_cost', 0)
 
         if delivery_cost > 0:
@@ -363,12 +404,7 @@ def handle_finish(update, context):
 
 
 def get_feedback(context):
-    message_text = '''\
-    Приятного аппетита! *место для рекламы*
-
-    *сообщение что делать если пицца не пришла*
-    '''
-    context.bot.send_message(chat_id=context.job.context, text=dedent(message_text))
+    context.bot.send_message(chat_id=context.job.context, text=templates.FEEDBACK_TEXT)
 
 
 def handle_users_reply(update, context):
@@ -381,9 +417,13 @@ def handle_users_reply(update, context):
         * Отправка команды боту
     Она получает стейт пользователя из базы данных и запускает соответствующую функцию-обработчик (хэндлер).
     Функция-обработчик возвращает следующее состояние, которое записывается в базу данных.
+    Если магазин недоступен, пользователь получает об этом сообщение и остаётся в прежнем состоянии.
+    При включённой трассировке обработка апдейта записывается в трассу, см. модуль tracing.
     Если пользователь только начал пользоваться ботом, Telegram форсит его написать "/start",
     поэтому по этой фразе выставляется стартовое состояние.
     Если пользователь захочет начать общение с ботом заново, он также может воспользоваться этой командой.
+    Команда "/start <магазин>" из ссылки вида t.me/<бот>?start=<магазин> привязывает чат к другому магазину,
+    а "/start" без магазина или с неизвестным магазином возвращает чат к магазину бота.
 
     Args:
         update (:class:`telegram.Update`): Incoming telegram update.
@@ -392,17 +432,29 @@ def handle_users_reply(update, context):
     Returns:
         None
     """
-    db = get_database_connection()
     if update.message:
-        user_reply = update.message.text
         chat_id = update.message.chat_id
     elif update.callback_query:
-        user_reply = update.callback_query.data
         chat_id = update.callback_query.message.chat_id
     else:
         return
-    if user_reply == '/start':
+    with tracing.trace('update', chat_id=chat_id, update_id=update.update_id):
+        process_users_reply(update, context, chat_id)
+
+
+def process_users_reply(update, context, chat_id):
+    db = get_database_connection()
+    if update.message:
+        user_reply = update.message.text
+    else:
+        user_reply = update.callback_query.data
+    if user_reply and user_reply.startswith('/start'):
         user_state = 'START'
+        store_name = user_reply[len('/start'):].strip()
+        if store_name and online_shop.is_store_configured(store_name):
+            db.set(get_chat_store_key(chat_id), store_name)
+        else:
+            db.delete(get_chat_store_key(chat_id))
     else:
         user_state = db.get(chat_id).decode('utf-8')
 
@@ -417,45 +469,199 @@ def handle_users_reply(update, context):
         'HANDLE_FINISH': handle_finish
     }
     state_handler = states_functions[user_state]
-    next_state = state_handler(update, context)
+    with online_shop.use_store(get_chat_store_name(context, chat_id)):
+        try:
+            with tracing.span(user_state, store=online_shop.get_current_store_name()):
+                next_state = state_handler(update, context)
+        except online_shop.REQUEST_ERRORS as e:
+            if not online_shop.is_store_unavailable(e):
+                raise
+            logger.warning(f'Магазин недоступен, чат {chat_id} остаётся в прежнем состоянии', exc_info=True)
+            if update.callback_query:
+                update.callback_query.answer(templates.STORE_UNAVAILABLE_TEXT, show_alert=True)
+            else:
+                update.message.reply_text(text=templates.STORE_UNAVAILABLE_TEXT)
+            return
     db.set(chat_id, next_state)
 
 
-def get_database_connection():
-    """Соединение с базой банных.
+def get_chat_store_name(context, chat_id):
+    """Магазин, к которому привязан чат, по умолчанию — магазин бота.
+
+    Привязка хранится в Redis рядом с состоянием чата, поэтому переживает перезапуск и видна всем репликам.
+    Если магазин убрали из STORES или удалили его ключи, привязка удаляется и чат возвращается к магазину бота.
+    """
+    db = get_database_connection()
+    store_name = db.get(get_chat_store_key(chat_id))
+    if store_name is None:
+        return context.bot_data['store_name']
+    store_name = store_name.decode('utf-8')
+    if not online_shop.is_store_configured(store_name):
+        logger.warning(f'Магазин {store_name} чата {chat_id} больше не настроен, чат переходит к магазину бота')
+        db.delete(get_chat_store_key(chat_id))
+        return context.bot_data['store_name']
+    return store_name
+
 
-    Возвращает конекшн с базой данных Redis, либо создаёт новый, если он ещё не создан.
+def get_message_fingerprint(message_id, text, reply_markup):
+    content = f'{text}\0{reply_markup.to_json()}'.encode('utf-8')
+    return f'{message_id}:{hashlib.sha1(content).hexdigest()}'
 
-    Returns:
-        (:class:`redis.Redis`): Redis client object
+
+def remember_message(message, text, reply_markup):
+    get_database_connection().set(get_message_fingerprint_key(message.chat_id),
+                                  get_message_fingerprint(message.message_id, text, reply_markup),
+                                  ex=MESSAGE_FINGERPRINT_EXPIRATION_TIME)
+
+
+def show_text(context, message, text, reply_markup):
+    """Показывает текст с кнопками вместо сообщения бота.
+
+    Текстовое сообщение редактируется, а если в нём уже тот же текст с теми же кнопками,
+    запрос к Telegram не отправляется. Сообщение с фото нельзя превратить в текстовое,
+    поэтому оно удаляется и отправляется новое.
+
+    Args:
+        context (:class:`telegram.ext.CallbackContext`): The context object passed to the callback.
+        message (:class:`telegram.Message`): сообщение бота, которое нужно заменить
+        text (str): текст сообщения
+        reply_markup (:class:`telegram.InlineKeyboardMarkup`): кнопки сообщения
     """
-    global _database
-    if _database is None:
-        database_password = os.environ['REDIS_PASSWORD']
-        database_host = os.environ['REDIS_HOST']
-        database_port = os.environ['REDIS_PORT']
-        _database = redis.Redis(host=database_host, port=database_port, password=database_password)
-    return _database
+    if message.photo:
+        context.bot.delete_message(chat_id=message.chat_id, message_id=message.message_id)
+        message = message.reply_text(text=text, reply_markup=reply_markup)
+    else:
+        shown_fingerprint = get_database_connection().get(get_message_fingerprint_key(message.chat_id))
+        if shown_fingerprint == get_message_fingerprint(message.message_id, text, reply_markup).encode('utf-8'):
+            logger.info(f'Сообщение {message.message_id} не изменилось')
+            return
+        try:
+            context.bot.edit_message_text(chat_id=message.chat_id, message_id=message.message_id, text=text,
+                                          reply_markup=reply_markup)
+        except BadRequest as e:
+            if 'not modified' not in e.message:
+                raise
+    remember_message(message, text, reply_markup)
+
+
+def show_photo(context, message, photo_url, caption, reply_markup):
+    """Показывает фото с подписью и кнопками вместо сообщения бота.
+
+    Сообщение с фото редактируется, а текстовое сообщение нельзя превратить в фото,
+    поэтому оно удаляется и отправляется новое.
+
+    Args:
+        context (:class:`telegram.ext.CallbackContext`): The context object passed to the callback.
+        message (:class:`telegram.Message`): сообщение бота, которое нужно заменить
+        photo_url (str): ссылка на фото
+        caption (str): подпись к фото
+        reply_markup (:class:`telegram.InlineKeyboardMarkup`): кнопки сообщения
+    """
+    if not message.photo:
+        context.bot.delete_message(chat_id=message.chat_id, message_id=message.message_id)
+        context.bot.send_photo(chat_id=message.chat_id, photo=photo_url, caption=caption, reply_markup=reply_markup)
+        return
+    try:
+        context.bot.edit_message_media(chat_id=message.chat_id, message_id=message.message_id,
+                                       media=InputMediaPhoto(media=photo_url, caption=caption),
+                                       reply_markup=reply_markup)
+    except BadRequest as e:
+        if 'not modified' not in e.message:
+            raise
+
+
+class TracedBot(telegram.Bot):
+    """Бот, запросы которого к Telegram попадают в трассу обработки апдейта."""
+
+    def _post(self, endpoint, *args, **kwargs):
+        with tracing.span(f'telegram {endpoint}'):
+            return super()._post(endpoint, *args, **kwargs)
 
 
 def handle_error(update, context):
     logger.error(msg="Exception while handling an update:", exc_info=context.error)
 
 
+def warm_up(updater):
+    """Прогрев бота перед началом опроса Telegram.
+
+    Получает токены всех магазинов, а затем параллельно загружает их каталоги и списки пиццерий в кэш
+    и открывает соединения с Redis, Elastic Path и Telegram. Ошибки прогрева не останавливают бота:
+    недогретые данные загрузятся при первом обращении.
+
+    Args:
+        updater (:class:`telegram.ext.Updater`): Updater бота
+    """
+    logger.info('Прогреваем бота')
+    store_names = online_shop.get_store_names()
+    for store_name in store_names:
+        with online_shop.use_store(store_name):
+            try:
+                online_shop.get_access_token()
+                online_shop.set_headers()
+            except Exception:
+                logger.exception(f'Не удалось получить токен магазина {store_name}')
+
+    warm_up_tasks = {
+        'Redis': lambda: get_database_connection().ping(),
+        'Telegram': updater.bot.get_me,
+    }
+    for store_name in store_names:
+        warm_up_tasks[f'каталог магазина {store_name}'] = partial(online_shop.run_in_store, store_name,
+                                                                  online_shop.get_all_products)
+        warm_up_tasks[f'пиццерии магазина {store_name}'] = partial(online_shop.run_in_store, store_name,
+                                                                   online_shop.get_pizzerias,
+                                                                   updater.dispatcher.bot_data['pizzerias_flow_name'])
+    with ThreadPoolExecutor(max_workers=len(warm_up_tasks)) as executor:
+        futures = {name: executor.submit(task) for name, task in warm_up_tasks.items()}
+    for name, future in futures.items():
+        try:
+            future.result()
+        except Exception:
+            logger.exception(f'Не удалось прогреть {name}')
+
+
+def reset_ready():
+    """Удаляет файл готовности, оставшийся от прошлого запуска, чтобы бот не казался готовым до прогрева."""
+    readiness_file_path = os.getenv('READINESS_FILE')
+    if readiness_file_path and os.path.exists(readiness_file_path):
+        os.remove(readiness_file_path)
+
+
+def set_ready():
+    """Сигнал готовности бота.
+
+    Если задана переменная окружения READINESS_FILE, создаёт этот файл с pid процесса
+    для проверки готовности при деплое.
+    """
+    readiness_file_path = os.getenv('READINESS_FILE')
+    if readiness_file_path:
+        with open(readiness_file_path, 'w') as readiness_file:
+            readiness_file.write(str(os.getpid()))
+    logger.info('Бот готов к работе')
+
+
 if __name__ == '__main__':
     logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
 
     load_dotenv()
-
-    online_shop.get_access_token()
-    online_shop.set_headers()
-
-    updater = Updater(os.environ['TELEGRAM_TOKEN'])
+    reset_ready()
+    online_shop.share_rate_limits(get_database_connection())
+
+    tracing.configure_from_env()
+    telegram_api_url = os.getenv('TELEGRAM_API_URL')
+    if tracing.is_enabled():
+        bot = TracedBot(os.environ['TELEGRAM_TOKEN'], base_url=telegram_api_url,
+                        request=Request(con_pool_size=UPDATER_WORKERS_NUMBER + 4))
+        updater = Updater(bot=bot, workers=UPDATER_WORKERS_NUMBER)
+    else:
+        updater = Updater(os.environ['TELEGRAM_TOKEN'], base_url=telegram_api_url, workers=UPDATER_WORKERS_NUMBER)
     dispatcher = updater.dispatcher
     dispatcher.add_handler(CallbackQueryHandler(handle_users_reply))
     dispatcher.add_handler(MessageHandler(Filters.text, handle_users_reply))
     dispatcher.add_handler(CommandHandler('start', handle_users_reply))
     dispatcher.add_handler(MessageHandler(Filters.location, handle_users_reply))
+    dispatcher.add_handler(InlineQueryHandler(handle_inline_query))
     dispatcher.add_handler(PreCheckoutQueryHandler(precheckout_callback))
     dispatcher.add_handler(MessageHandler(Filters.successful_payment, successful_payment_callback))
     dispatcher.add_error_handler(handle_error)
@@ -467,5 +673,9 @@ if __name__ == '__main__':
     dispatcher.bot_data['pizzerias_flow_name'] = 'Pizzeria'
     dispatcher.bot_data['currency'] = 'RUB'
     dispatcher.bot_data['payload_name'] = 'Custom-Payload'
+    dispatcher.bot_data['store_name'] = os.getenv('STORE_NAME', online_shop.DEFAULT_STORE_NAME)
 
+    warm_up(updater)
     updater.start_polling()
+    set_ready()
+    updater.idle()
@@ -0,0 +1,141 @@
+import argparse
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import telegram
+from dotenv import load_dotenv
+from telegram.error import RetryAfter, TelegramError, Unauthorized
+from telegram.utils.request import Request
+
+from database import get_database_connection
+from rate_limiter import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_MESSAGES_PER_SECOND = 25
+SENDERS_NUMBER = 8
+SCAN_BATCH_SIZE = 1000
+SEND_RETRIES_NUMBER = 3
+
+
+def get_broadcast_key(broadcast_id):
+    return f'broadcast:{broadcast_id}'
+
+
+def get_statuses_key(broadcast_id):
+    return f'broadcast:{broadcast_id}:statuses'
+
+
+def is_chat_id(key):
+    return key.lstrip(b'-').isdigit()
+
+
+def send_message(bot, rate_limiter, chat_id, text):
+    """Отправляет сообщение в чат с учётом лимитов Telegram.
+
+    Returns:
+        str: статус отправки: sent, blocked или failed
+    """
+    for _ in range(SEND_RETRIES_NUMBER):
+        rate_limiter.acquire()
+        started_at = time.monotonic()
+        retry_after = None
+        try:
+            bot.send_message(chat_id=chat_id, text=text)
+            return 'sent'
+        except RetryAfter as e:
+            retry_after = e.retry_after
+        except Unauthorized:
+            return 'blocked'
+        except TelegramError as e:
+            logger.warning(f'Не удалось отправить сообщение в чат {chat_id}: {e}')
+            return 'failed'
+        finally:
+            rate_limiter.release(time.monotonic() - started_at, bool(retry_after), retry_after)
+    return 'failed'
+
+
+def send_and_record_message(db, bot, rate_limiter, broadcast_id, chat_id, text):
+    status = send_message(bot, rate_limiter, chat_id, text)
+    pipe = db.pipeline()
+    pipe.hset(get_statuses_key(broadcast_id), chat_id, status)
+    pipe.hincrby(get_broadcast_key(broadcast_id), status, 1)
+    pipe.execute()
+    return status
+
+
+def broadcast(db, bot, broadcast_id, text):
+    """Рассылает сообщение во все чаты из базы данных.
+
+    Чаты читаются из Redis порциями через SCAN, поэтому память не зависит от числа получателей.
+    После каждой порции в Redis сохраняется курсор, и прерванную рассылку с тем же broadcast_id
+    можно продолжить. Статус каждого получателя записывается в хэш broadcast:<broadcast_id>:statuses
+    сразу после отправки, уже получившие сообщение чаты пропускаются.
+
+    Args:
+        db (:class:`redis.Redis`): Redis client object
+        bot (:class:`telegram.Bot`): бот, от имени которого идёт рассылка
+        broadcast_id (str): id рассылки
+        text (str): текст сообщения
+
+    Returns:
+        dict: число получателей по статусам отправки
+    """
+    broadcast_key = get_broadcast_key(broadcast_id)
+    statuses_key = get_statuses_key(broadcast_id)
+    if db.hget(broadcast_key, 'finished'):
+        logger.info(f'Рассылка {broadcast_id} уже завершена')
+        return get_statuses_count(db, broadcast_id)
+
+    cursor = int(db.hget(broadcast_key, 'cursor') or 0)
+    rate_limiter = RateLimiter(TELEGRAM_MESSAGES_PER_SECOND, TELEGRAM_MESSAGES_PER_SECOND, SENDERS_NUMBER)
+    with ThreadPoolExecutor(max_workers=SENDERS_NUMBER) as executor:
+        while True:
+            cursor, keys = db.scan(cursor, count=SCAN_BATCH_SIZE)
+            chat_ids = [key.decode('utf-8') for key in keys if is_chat_id(key)]
+            previous_statuses = db.hmget(statuses_key, chat_ids) if chat_ids else []
+            recipients = [
+                chat_id for chat_id, status in zip(chat_ids, previous_statuses)
+                if status not in (b'sent', b'blocked')
+            ]
+            # Статус записывается сразу после отправки, чтобы после сбоя посреди порции не отправить повторно
+            send = partial(send_and_record_message, db, bot, rate_limiter, broadcast_id, text=text)
+            list(executor.map(lambda chat_id: send(chat_id=chat_id), recipients))
+
+            pipe = db.pipeline()
+            pipe.hset(broadcast_key, 'cursor', cursor)
+            if cursor == 0:
+                pipe.hset(broadcast_key, 'finished', int(time.time()))
+            pipe.execute()
+            logger.info(f'Рассылка {broadcast_id}: обработано {len(recipients)} чатов, курсор {cursor}')
+            if cursor == 0:
+                break
+
+    return get_statuses_count(db, broadcast_id)
+
+
+def get_statuses_count(db, broadcast_id):
+    broadcast_state = db.hgetall(get_broadcast_key(broadcast_id))
+    return {status: int(broadcast_state.get(status.encode(), 0)) for status in ('sent', 'blocked', 'failed')}
+
+
+def main():
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description='Рассылка сообщения всем пользователям бота')
+    parser.add_argument('broadcast_id', help='id рассылки, по нему прерванная рассылка продолжается')
+    parser.add_argument('text', help='текст сообщения')
+    args = parser.parse_args()
+
+    bot = telegram.Bot(os.environ['TELEGRAM_TOKEN'], request=Request(con_pool_size=SENDERS_NUMBER))
+    statuses_count = broadcast(get_database_connection(), bot, args.broadcast_id, args.text)
+    logger.info(f'Рассылка {args.broadcast_id} завершена: {statuses_count}')
+
+
+if __name__ == '__main__':
+    main()
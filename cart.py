@@ -0,0 +1,231 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import redis
+
+import online_shop
+from models import Cart, CartItem
+
+logger = logging.getLogger(__name__)
+
+SYNC_WORKERS_NUMBER = 4
+SYNC_RETRIES_NUMBER = 10
+SYNC_RETRY_DELAY = 30
+# Операции живут в памяти процесса, поэтому их счётчик истекает, если процесс упал, не успев их выполнить
+PENDING_OPERATIONS_TTL = (SYNC_RETRIES_NUMBER + 2) * SYNC_RETRY_DELAY
+LOST_CHANGES_NOTICE_TTL = 24 * 60 * 60
+
+# По одному потоку на шард: операции одной корзины выполняются строго по очереди
+_sync_executors = [ThreadPoolExecutor(max_workers=1) for _ in range(SYNC_WORKERS_NUMBER)]
+
+
+def get_cart_key(chat_id):
+    return f'cart:{online_shop.get_current_store_name()}:{chat_id}'
+
+
+def get_synced_flag_key(chat_id):
+    return f'cart-synced:{online_shop.get_current_store_name()}:{chat_id}'
+
+
+def get_pending_operations_key(chat_id):
+    return f'cart-pending:{online_shop.get_current_store_name()}:{chat_id}'
+
+
+def get_lost_changes_key(chat_id):
+    return f'cart-lost:{online_shop.get_current_store_name()}:{chat_id}'
+
+
+def add_product(db, chat_id, product_id, quantity):
+    """Добавляет товар в локальную корзину и ставит синхронизацию с CRM в очередь.
+
+    Args:
+        db (:class:`redis.Redis`): Redis client object
+        chat_id (int): id чата, он же reference корзины в CRM
+        product_id (str): id товара
+        quantity (int): количество товара
+    """
+    logger.info(f'Добавляем товар с id {product_id} в количестве {quantity} в локальную корзину {chat_id}')
+    pipe = _start_operation(db, chat_id)
+    pipe.hincrby(get_cart_key(chat_id), product_id, quantity)
+    pipe.execute()
+    _schedule(db, chat_id, 0, online_shop.add_product_to_cart, chat_id, product_id, quantity)
+
+
+def add_products(db, chat_id, products):
+    """Добавляет в локальную корзину несколько товаров, в CRM они уходят одним пакетом.
+
+    Args:
+        db (:class:`redis.Redis`): Redis client object
+        chat_id (int): id чата, он же reference корзины в CRM
+        products (list): пары (id товара, количество)
+    """
+    logger.info(f'Добавляем товары {products} в локальную корзину {chat_id}')
+    pipe = _start_operation(db, chat_id)
+    for product_id, quantity in products:
+        pipe.hincrby(get_cart_key(chat_id), product_id, quantity)
+    pipe.execute()
+    _schedule(db, chat_id, 0, online_shop.add_products_to_cart, chat_id, products)
+
+
+def remove_product(db, chat_id, product_id):
+    """Удаляет товар из локальной корзины и ставит синхронизацию с CRM в очередь.
+
+    Args:
+        db (:class:`redis.Redis`): Redis client object
+        chat_id (int): id чата, он же reference корзины в CRM
+        product_id (str): id товара
+    """
+    logger.info(f'Удаляем товар с id {product_id} из локальной корзины {chat_id}')
+    pipe = _start_operation(db, chat_id)
+    pipe.hdel(get_cart_key(chat_id), product_id)
+    pipe.execute()
+    _schedule(db, chat_id, 0, _remove_product_from_crm_cart, chat_id, product_id)
+
+
+def get_cart(db, chat_id):
+    """Возвращает состав корзины и сумму, посчитанные по закэшированным ценам каталога.
+
+    Если локальной копии корзины ещё нет, она загружается из CRM. Если CRM недоступна,
+    корзина собирается из того, что есть в локальной копии.
+
+    Args:
+        db (:class:`redis.Redis`): Redis client object
+        chat_id (int): id чата, он же reference корзины в CRM
+
+    Returns:
+        (:class:`models.Cart`): корзина
+    """
+    pending_operations_number = int(db.get(get_pending_operations_key(chat_id)) or 0)
+    if not db.exists(get_synced_flag_key(chat_id)) and not pending_operations_number:
+        try:
+            reconcile(db, chat_id)
+        except online_shop.REQUEST_ERRORS as e:
+            if not online_shop.is_store_unavailable(e):
+                raise
+            logger.warning(f'CRM недоступна, выводим корзину {chat_id} из локальной копии')
+
+    products = {product.id: product for product in online_shop.get_all_products()}
+    cart_items = []
+    for product_id, quantity in db.hgetall(get_cart_key(chat_id)).items():
+        product_id = product_id.decode('utf-8')
+        product = products.get(product_id)
+        if not product:
+            logger.warning(f'Товар с id {product_id} из корзины {chat_id} не найден в каталоге')
+            continue
+        cart_items.append(CartItem(product.id, product.name, product.description, int(quantity), product.price))
+    return Cart(tuple(cart_items))
+
+
+def pop_lost_changes(db, chat_id):
+    """Проверяет, были ли потеряны изменения корзины, и сбрасывает отметку о них.
+
+    Returns:
+        bool: изменения корзины не дошли до CRM и пропали при сверке
+    """
+    pipe = db.pipeline()
+    pipe.exists(get_lost_changes_key(chat_id))
+    pipe.delete(get_lost_changes_key(chat_id))
+    is_lost, _ = pipe.execute()
+    return bool(is_lost)
+
+
+def reconcile(db, chat_id):
+    """Перезаписывает локальную корзину состоянием корзины в CRM.
+
+    Если пока шёл запрос к CRM корзину изменили, перезапись пропускается: изменение ещё не дошло
+    до CRM, и корзину сверит синхронизация этого изменения.
+    """
+    logger.info(f'Сверяем локальную корзину {chat_id} с CRM')
+    quantities = {}
+    for cart_item in online_shop.get_cart_items(chat_id):
+        product_id = cart_item['product_id']
+        quantities[product_id] = quantities.get(product_id, 0) + cart_item['quantity']
+
+    with db.pipeline() as pipe:
+        try:
+            pipe.watch(get_pending_operations_key(chat_id))
+            if int(pipe.get(get_pending_operations_key(chat_id)) or 0) > 0:
+                logger.info(f'Корзина {chat_id} изменилась, сверка отложена')
+                return
+            pipe.multi()
+            pipe.delete(get_cart_key(chat_id))
+            if quantities:
+                pipe.hset(get_cart_key(chat_id), mapping=quantities)
+            pipe.set(get_synced_flag_key(chat_id), 1)
+            pipe.execute()
+        except redis.WatchError:
+            logger.info(f'Корзина {chat_id} изменилась, сверка отложена')
+
+
+def _remove_product_from_crm_cart(chat_id, product_id):
+    for cart_item in online_shop.get_cart_items(chat_id):
+        if cart_item['product_id'] == product_id:
+            online_shop.remove_product_from_cart(chat_id, cart_item['id'])
+
+
+def _start_operation(db, chat_id):
+    """Транзакция изменения локальной корзины вместе со счётчиком операций, ожидающих синхронизации.
+
+    Изменение и счётчик записываются атомарно, поэтому сверка с CRM не может вклиниться между ними.
+    Флаг синхронизации снимается: если операция потеряется, корзина будет сверена заново.
+    """
+    pipe = db.pipeline()
+    pipe.incr(get_pending_operations_key(chat_id))
+    pipe.expire(get_pending_operations_key(chat_id), PENDING_OPERATIONS_TTL)
+    pipe.delete(get_synced_flag_key(chat_id))
+    return pipe
+
+
+def _finish_operation(db, chat_id):
+    """Уменьшает счётчик операций, ожидающих синхронизации, и удаляет его, когда операций не осталось."""
+    pending_operations_key = get_pending_operations_key(chat_id)
+    with db.pipeline() as pipe:
+        while True:
+            try:
+                pipe.watch(pending_operations_key)
+                pending_operations_number = int(pipe.get(pending_operations_key) or 0) - 1
+                pipe.multi()
+                if pending_operations_number > 0:
+                    pipe.decr(pending_operations_key)
+                else:
+                    pipe.delete(pending_operations_key)
+                pipe.execute()
+                return pending_operations_number
+            except redis.WatchError:
+                continue
+
+
+def _schedule(db, chat_id, attempt, fnc, *args):
+    executor = _sync_executors[hash(chat_id) % SYNC_WORKERS_NUMBER]
+    store_name = online_shop.get_current_store_name()
+    executor.submit(online_shop.run_in_store, store_name, _sync, db, chat_id, attempt, fnc, *args)
+
+
+def _sync(db, chat_id, attempt, fnc, *args):
+    try:
+        fnc(*args)
+    except Exception as e:
+        if online_shop.is_store_unavailable(e) and attempt < SYNC_RETRIES_NUMBER:
+            # Пока CRM недоступна, операция ждёт в очереди, а локальная корзина уже изменена
+            logger.warning(f'CRM недоступна, повторим синхронизацию корзины {chat_id} через {SYNC_RETRY_DELAY} с')
+            db.expire(get_pending_operations_key(chat_id), PENDING_OPERATIONS_TTL)
+            store_name = online_shop.get_current_store_name()
+            retry_timer = threading.Timer(SYNC_RETRY_DELAY, online_shop.run_in_store,
+                                          args=(store_name, _schedule, db, chat_id, attempt + 1, fnc, *args))
+            retry_timer.daemon = True
+            retry_timer.start()
+            return
+        # Ошибку фонового потока некому пробросить: изменение пропадёт при сверке, поэтому покупатель
+        # увидит предупреждение при следующем открытии корзины
+        logger.exception(f'Изменение корзины {chat_id} не попало в CRM и будет потеряно: {fnc.__name__}{args}')
+        db.set(get_lost_changes_key(chat_id), 1, ex=LOST_CHANGES_NOTICE_TTL)
+
+    pending_operations_number = _finish_operation(db, chat_id)
+    if pending_operations_number > 0:
+        return
+    try:
+        reconcile(db, chat_id)
+    except Exception:
+        logger.exception(f'Не удалось сверить корзину {chat_id} с CRM')
+        db.delete(get_synced_flag_key(chat_id))
@@ -0,0 +1,63 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class CircuitOpenError(Exception):
+    """Запрос не отправлен, потому что размыкатель открыт."""
+
+
+class CircuitBreaker:
+    """Размыкатель для одного эндпоинта API.
+
+    После failures_threshold ошибок подряд размыкатель открывается, и запросы к эндпоинту сразу
+    завершаются CircuitOpenError. Через reset_timeout секунд пропускается один пробный запрос:
+    если он успешен, размыкатель закрывается, иначе снова открывается.
+
+    Args:
+        name (str): название эндпоинта для логов
+        failures_threshold (int): число ошибок подряд, после которого размыкатель открывается
+        reset_timeout (float): через сколько секунд пропустить пробный запрос
+    """
+
+    def __init__(self, name, failures_threshold=5, reset_timeout=30):
+        self.name = name
+        self.failures_threshold = failures_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures_number = 0
+        self.opened_at = 0
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Проверяет, можно ли отправить запрос, иначе выбрасывает CircuitOpenError."""
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                logger.info(f'Пропускаем пробный запрос к {self.name}')
+                self.state = HALF_OPEN
+                return
+            raise CircuitOpenError(f'{self.name} временно недоступен')
+
+    def record_success(self):
+        with self._lock:
+            if self.state != CLOSED:
+                logger.info(f'Размыкатель {self.name} закрыт')
+            self.state = CLOSED
+            self.failures_number = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures_number += 1
+            if self.state == HALF_OPEN or self.failures_number >= self.failures_threshold:
+                if self.state != OPEN:
+                    logger.warning(f'Размыкатель {self.name} открыт после {self.failures_number} ошибок')
+                self.state = OPEN
+                self.opened_at = time.monotonic()
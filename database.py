@@ -0,0 +1,44 @@
+import os
+
+import redis
+
+import tracing
+
+_database = None
+
+
+class TracedRedis(redis.Redis):
+    """Клиент Redis, команды которого попадают в трассу обработки апдейта."""
+
+    def execute_command(self, *args, **options):
+        with tracing.span(f'redis {args[0]}'):
+            return super().execute_command(*args, **options)
+
+
+def get_chat_store_key(chat_id):
+    return f'store:{chat_id}'
+
+
+def get_message_fingerprint_key(chat_id):
+    return f'message-fingerprint:{chat_id}'
+
+
+def is_database_configured():
+    return 'REDIS_HOST' in os.environ
+
+
+def get_database_connection():
+    """Соединение с базой банных.
+
+    Возвращает конекшн с базой данных Redis, либо создаёт новый, если он ещё не создан.
+
+    Returns:
+        (:class:`redis.Redis`): Redis client object
+    """
+    global _database
+    if _database is None:
+        database_password = os.environ['REDIS_PASSWORD']
+        database_host = os.environ['REDIS_HOST']
+        database_port = os.environ['REDIS_PORT']
+        _database = TracedRedis(host=database_host, port=database_port, password=database_password)
+    return _database
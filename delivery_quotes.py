@@ -0,0 +1,101 @@
+import hashlib
+import logging
+
+import online_shop
+from models import DeliveryQuote
+from utils import get_nearest_pizzeria, get_delivery_cost_and_message_text
+
+logger = logging.getLogger(__name__)
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+# Ячейка geohash из 7 символов — примерно 150 × 150 м
+GEOHASH_PRECISION = 7
+QUOTE_TTL = 24 * 60 * 60
+
+
+def get_geohash_cell(latitude, longitude, precision=GEOHASH_PRECISION):
+    """Ячейка geohash, в которую попадает точка.
+
+    Returns:
+        tuple: geohash ячейки и координаты её центра
+    """
+    latitude_range = [-90.0, 90.0]
+    longitude_range = [-180.0, 180.0]
+    geohash = []
+    bits_number = 0
+    char_index = 0
+    is_longitude_bit = True
+    while len(geohash) < precision:
+        coordinate, coordinate_range = (longitude, longitude_range) if is_longitude_bit else (latitude, latitude_range)
+        middle = (coordinate_range[0] + coordinate_range[1]) / 2
+        char_index <<= 1
+        if coordinate >= middle:
+            char_index |= 1
+            coordinate_range[0] = middle
+        else:
+            coordinate_range[1] = middle
+        is_longitude_bit = not is_longitude_bit
+        bits_number += 1
+        if bits_number == 5:
+            geohash.append(GEOHASH_ALPHABET[char_index])
+            bits_number = 0
+            char_index = 0
+    center = (sum(latitude_range) / 2, sum(longitude_range) / 2)
+    return ''.join(geohash), center
+
+
+def get_registry_version(pizzerias):
+    """Версия списка пиццерий, одинаковая во всех процессах бота.
+
+    online_shop.get_pizzerias отдаёт один и тот же список, пока не обновит кэш, поэтому версия
+    считается один раз на список и хранится рядом с кэшем магазина.
+    """
+    caches = online_shop.get_client().caches
+    cached = caches.get('registry_version')
+    if cached and cached['pizzerias'] is pizzerias:
+        return cached['version']
+    serialized_pizzerias = '\n'.join(sorted(pizzeria.to_json() for pizzeria in pizzerias))
+    registry_version = hashlib.sha1(serialized_pizzerias.encode('utf-8')).hexdigest()[:12]
+    caches['registry_version'] = {'pizzerias': pizzerias, 'version': registry_version}
+    return registry_version
+
+
+def get_quote_key(registry_version, geohash):
+    return f'delivery-quote:{online_shop.get_current_store_name()}:{registry_version}:{geohash}'
+
+
+def calculate_delivery_quote(position, pizzerias):
+    nearest_pizzeria, nearest_pizzeria_distance = get_nearest_pizzeria(position, pizzerias)
+    delivery_cost, message_text = get_delivery_cost_and_message_text(nearest_pizzeria, nearest_pizzeria_distance)
+    return DeliveryQuote(nearest_pizzeria.id, nearest_pizzeria_distance, delivery_cost, message_text)
+
+
+def get_delivery_quote(db, current_position, pizzerias):
+    """Ближайшая пиццерия, стоимость доставки и текст сообщения для координат покупателя.
+
+    Расчёт делается для центра ячейки geohash и хранится в Redis, поэтому все покупатели из одной
+    ячейки получают одинаковый ответ, а повторный запрос — одно чтение ключа. Версия списка пиццерий
+    входит в ключ, так что при изменении списка старые расчёты больше не читаются и истекают по TTL.
+
+    Args:
+        db (:class:`redis.Redis`): Redis client object
+        current_position (tuple): широта и долгота покупателя
+        pizzerias (list): пиццерии магазина
+
+    Returns:
+        tuple: ближайшая пиццерия (:class:`models.Pizzeria`), стоимость доставки и текст сообщения
+    """
+    geohash, cell_center = get_geohash_cell(*map(float, current_position))
+    quote_key = get_quote_key(get_registry_version(pizzerias), geohash)
+
+    pizzerias_by_id = {pizzeria.id: pizzeria for pizzeria in pizzerias}
+    serialized_quote = db.get(quote_key)
+    if serialized_quote:
+        quote = DeliveryQuote.from_json(serialized_quote)
+        logger.info(f'Расчёт доставки для ячейки {geohash} взят из кэша')
+    if not serialized_quote or quote.pizzeria_id not in pizzerias_by_id:
+        if serialized_quote:
+            logger.warning(f'Пиццерии {quote.pizzeria_id} из расчёта для ячейки {geohash} нет в списке, считаем заново')
+        quote = calculate_delivery_quote(cell_center, pizzerias)
+        db.set(quote_key, quote.to_json(), ex=QUOTE_TTL)
+    return pizzerias_by_id[quote.pizzeria_id], quote.delivery_cost, quote.message_text
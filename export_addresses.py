@@ -0,0 +1,126 @@
+import argparse
+import csv
+import gzip
+import logging
+import os
+
+import numpy as np
+from dotenv import load_dotenv
+
+from database import get_database_connection, is_database_configured
+import online_shop
+from models import CustomerAddress
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_M = 6371008.8
+CHUNK_SIZE = 10000
+DELIVERY_RADIUS_M = 20000
+
+
+def get_distances(latitudes, longitudes, pizzerias_latitudes, pizzerias_longitudes):
+    """Расстояния в метрах от каждого адреса до каждой пиццерии по формуле гаверсинусов.
+
+    Returns:
+        (:class:`numpy.ndarray`): матрица расстояний размером адреса × пиццерии
+    """
+    latitudes = np.radians(latitudes)[:, np.newaxis]
+    longitudes = np.radians(longitudes)[:, np.newaxis]
+    pizzerias_latitudes = np.radians(pizzerias_latitudes)[np.newaxis, :]
+    pizzerias_longitudes = np.radians(pizzerias_longitudes)[np.newaxis, :]
+    haversine = (
+        np.sin((pizzerias_latitudes - latitudes) / 2) ** 2
+        + np.cos(latitudes) * np.cos(pizzerias_latitudes) * np.sin((pizzerias_longitudes - longitudes) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(haversine))
+
+
+def iter_address_chunks(flow_slug):
+    chunk = []
+    for entries in online_shop.iter_entries_pages(flow_slug):
+        chunk.extend(CustomerAddress.from_api(entry) for entry in entries)
+        if len(chunk) >= CHUNK_SIZE:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def export_addresses(addresses_file_path, demand_file_path, pizzerias_flow_name='Pizzeria',
+                     addresses_flow_name='Customer_Address'):
+    """Выгружает адреса покупателей с ближайшими пиццериями и спрос по пиццериям.
+
+    Адреса читаются из CRM постранично и обрабатываются порциями по CHUNK_SIZE строк, поэтому
+    в памяти никогда не лежит больше одной порции. Ближайшая пиццерия и расстояние до неё считаются
+    для всей порции сразу матричными операциями numpy.
+
+    Args:
+        addresses_file_path (str): путь к сжатому gzip CSV с адресами
+        demand_file_path (str): путь к CSV со спросом по пиццериям
+        pizzerias_flow_name (str): slug flow с пиццериями
+        addresses_flow_name (str): slug flow с адресами покупателей
+    """
+    pizzerias = online_shop.get_pizzerias(pizzerias_flow_name)
+    pizzerias_latitudes = np.array([pizzeria.latitude for pizzeria in pizzerias])
+    pizzerias_longitudes = np.array([pizzeria.longitude for pizzeria in pizzerias])
+
+    orders_numbers = np.zeros(len(pizzerias), dtype=np.int64)
+    distances_sums = np.zeros(len(pizzerias))
+    deliverable_orders_numbers = np.zeros(len(pizzerias), dtype=np.int64)
+    with gzip.open(addresses_file_path, 'wt', encoding='utf-8', newline='') as addresses_file:
+        writer = csv.writer(addresses_file)
+        writer.writerow(['address_id', 'chat_id', 'latitude', 'longitude', 'pizzeria_id', 'distance_m'])
+        for addresses in iter_address_chunks(addresses_flow_name):
+            latitudes = np.array([address.latitude for address in addresses])
+            longitudes = np.array([address.longitude for address in addresses])
+            distances = get_distances(latitudes, longitudes, pizzerias_latitudes, pizzerias_longitudes)
+            nearest_pizzerias_indexes = distances.argmin(axis=1)
+            nearest_distances = distances[np.arange(len(addresses)), nearest_pizzerias_indexes]
+
+            orders_numbers += np.bincount(nearest_pizzerias_indexes, minlength=len(pizzerias))
+            distances_sums += np.bincount(nearest_pizzerias_indexes, weights=nearest_distances,
+                                          minlength=len(pizzerias))
+            deliverable_orders_numbers += np.bincount(nearest_pizzerias_indexes[nearest_distances <= DELIVERY_RADIUS_M],
+                                                      minlength=len(pizzerias))
+
+            writer.writerows(
+                (address.id, address.chat_id, f'{address.latitude:.6f}', f'{address.longitude:.6f}',
+                 pizzerias[pizzeria_index].id, int(distance))
+                for address, pizzeria_index, distance in zip(addresses, nearest_pizzerias_indexes, nearest_distances)
+            )
+            logger.info(f'Выгружено {len(addresses)} адресов')
+
+    mean_distances = np.divide(distances_sums, orders_numbers, out=np.zeros(len(pizzerias)),
+                               where=orders_numbers > 0)
+    with open(demand_file_path, 'w', encoding='utf-8', newline='') as demand_file:
+        writer = csv.writer(demand_file)
+        writer.writerow(['pizzeria_id', 'alias', 'latitude', 'longitude', 'orders', 'deliverable_orders',
+                         'mean_distance_m'])
+        for pizzeria, orders_number, deliverable_orders_number, mean_distance in zip(
+                pizzerias, orders_numbers, deliverable_orders_numbers, mean_distances):
+            writer.writerow([pizzeria.id, pizzeria.alias, pizzeria.latitude, pizzeria.longitude,
+                             orders_number, deliverable_orders_number, int(mean_distance)])
+    logger.info(f'Всего выгружено {orders_numbers.sum()} адресов')
+
+
+def main():
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+
+    load_dotenv()
+    if is_database_configured():
+        online_shop.share_rate_limits(get_database_connection())
+
+    parser = argparse.ArgumentParser(description='Выгрузка адресов покупателей и спроса по пиццериям')
+    parser.add_argument('--addresses', default='customer_addresses.csv.gz', help='файл для адресов покупателей')
+    parser.add_argument('--demand', default='pizzerias_demand.csv', help='файл для спроса по пиццериям')
+    args = parser.parse_args()
+
+    with online_shop.use_store(os.getenv('STORE_NAME', online_shop.DEFAULT_STORE_NAME)), online_shop.bulk_priority():
+        online_shop.get_access_token()
+        online_shop.set_headers()
+
+        export_addresses(args.addresses, args.demand)
+
+
+if __name__ == '__main__':
+    main()
@@ -6,7 +6,7 @@ def get_products_keyboard(products):
     for product in products:
         keyboard.append(
             [
-                InlineKeyboardButton(product['name'], callback_data=product['id'])
+                InlineKeyboardButton(product.name, callback_data=product.id)
             ]
         )
     return keyboard
@@ -19,7 +19,7 @@ def get_purchase_options_keyboard(product):
     purchase_option_button = []
     for purchase_option in purchase_options:
         purchase_option_button.append(
-            InlineKeyboardButton(f'{purchase_option} шт.', callback_data=f'{product["id"]},{purchase_option}')
+            InlineKeyboardButton(f'{purchase_option} шт.', callback_data=f'{product.id},{purchase_option}')
         )
     keyboard.append(purchase_option_button)
     return keyboard
@@ -33,27 +33,20 @@ def get_menu_button():
     return InlineKeyboardButton('В меню', callback_data='back')
 
 
+def get_search_button():
+    return InlineKeyboardButton('Поиск', switch_inline_query_current_chat='')
+
+
 def get_payment_button():
     return InlineKeyboardButton('Оплата', callback_data='payment')
 
 
-def get_text_and_buttons_for_cart(products):
-    cart_text = ' '
+def get_cart_keyboard(cart_items):
     keyboard = []
-    for product in products:
-        product_price = product['meta']['display_price']['with_tax']
-
-        cart_text = f"""
-        {cart_text}
-        {product['name']}
-        {product['description']}
-        {product_price['unit']['formatted']}
-        {product["quantity"]} шт. на сумму {product_price["value"]["formatted"]}
-        """
-
-        keyboard.append([InlineKeyboardButton(f'Убрать из корзины {product["name"]}',
-                                              callback_data=product['id'])])
-    return keyboard, cart_text
+    for cart_item in cart_items:
+        keyboard.append([InlineKeyboardButton(f'Убрать из корзины {cart_item.name}',
+                                              callback_data=cart_item.product_id)])
+    return keyboard
 
 
 def get_pagination_buttons(next_page_number, page_number, pages_count, previous_page_number):
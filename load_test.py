@@ -0,0 +1,596 @@
+import argparse
+import itertools
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from dotenv import load_dotenv
+
+from cart import get_cart_key, get_pending_operations_key, get_synced_flag_key
+from database import get_chat_store_key, get_database_connection, get_message_fingerprint_key
+from online_shop import get_rate_limit_key
+from shop_data import open_json_file
+from templates import FEEDBACK_TEXT, STORE_UNAVAILABLE_TEXT
+
+logger = logging.getLogger(__name__)
+
+BOT_ID = 100000
+COURIER_CHAT_ID = 1
+FIRST_CHAT_ID = 10 ** 12
+REPLY_TIMEOUT = 10
+STATE_TIMEOUT = 5
+READINESS_TIMEOUT = 120
+ENTRIES_PAGE_LIMIT = 100
+STORE_CLIENT_ID = 'load-test'
+# Доля лимита запросов к Elastic Path, при которой прогон считается упёршимся в лимит, а не в бота
+RATE_LIMIT_SATURATION = 0.8
+# Ответы бота, которыми заканчивается обработка апдейта; deleteMessage и сообщения курьеру к ним не относятся
+REPLY_METHODS = {'sendMessage', 'sendPhoto', 'editMessageText', 'answerCallbackQuery', 'sendInvoice'}
+
+
+def get_replica_token(replica_number):
+    return f'{BOT_ID + replica_number}:load-test'
+
+
+class JsonRequestHandler(BaseHTTPRequestHandler):
+    """Обработчик HTTP-запросов заглушки: разбирает JSON или форму и отвечает JSON."""
+
+    def do_GET(self):
+        self.handle_stub_request('GET')
+
+    def do_POST(self):
+        self.handle_stub_request('POST')
+
+    def do_DELETE(self):
+        self.handle_stub_request('DELETE')
+
+    def handle_stub_request(self, method):
+        url = urlsplit(self.path)
+        params = {name: values[0] for name, values in parse_qs(url.query).items()}
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if self.headers.get('Content-Type', '').startswith('application/json'):
+            params.update(json.loads(body or '{}'))
+        else:
+            params.update({name: values[0] for name, values in parse_qs(body.decode('utf-8')).items()})
+
+        status, payload = self.server.stub.handle(method, url.path, params)
+        content = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server(stub):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), JsonRequestHandler)
+    server.daemon_threads = True
+    server.stub = stub
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+class TelegramStub:
+    """Заглушка Bot API для нескольких реплик бота.
+
+    У каждой реплики свой токен и своя очередь getUpdates. Апдейт чата попадает в очередь реплики
+    по chat_id (sticky) или по кругу (round-robin), как у балансировщика перед вебхуками.
+    Ответы бота записываются по чатам, симулированные пользователи ждут их в wait_reply.
+
+    Args:
+        tokens (list): токены реплик
+        routing (str): sticky или round-robin
+    """
+
+    def __init__(self, tokens, routing):
+        self.tokens = tokens
+        self.routing = routing
+        self.updates = {token: [] for token in tokens}
+        self.updates_condition = threading.Condition()
+        self.update_ids = itertools.count(1)
+        self.message_ids = itertools.count(1)
+        self.callback_query_ids = itertools.count(1)
+        self.round_robin_counter = itertools.count()
+        self.callback_query_chats = {}
+        self.replies = defaultdict(list)
+        self.replies_lock = threading.Lock()
+        self.replies_conditions = {}
+
+    def get_replica_token(self, chat_id):
+        if self.routing == 'sticky':
+            return self.tokens[chat_id % len(self.tokens)]
+        return self.tokens[next(self.round_robin_counter) % len(self.tokens)]
+
+    def send_message(self, chat_id, **content):
+        """Отправляет боту сообщение от пользователя."""
+        message = self.make_message(chat_id, chat_id, **content)
+        self.put_update(chat_id, {'message': message})
+
+    def press_button(self, chat_id, message, callback_data):
+        """Нажимает inline-кнопку под сообщением бота."""
+        callback_query_id = str(next(self.callback_query_ids))
+        with self.replies_lock:
+            self.callback_query_chats[callback_query_id] = chat_id
+        callback_query = {
+            'id': callback_query_id,
+            'from': get_user(chat_id),
+            'chat_instance': str(chat_id),
+            'data': callback_data,
+            'message': message,
+        }
+        self.put_update(chat_id, {'callback_query': callback_query})
+
+    def put_update(self, chat_id, update):
+        token = self.get_replica_token(chat_id)
+        with self.updates_condition:
+            self.updates[token].append({'update_id': next(self.update_ids), **update})
+            self.updates_condition.notify_all()
+
+    def get_replies_number(self, chat_id):
+        with self.replies_lock:
+            return len(self.replies[chat_id])
+
+    def wait_reply(self, chat_id, replies_number, timeout=REPLY_TIMEOUT):
+        """Ждёт ответ бота в чат после первых replies_number ответов.
+
+        Returns:
+            dict: отправленное сообщение или параметры запроса к Bot API, None — если ответа нет
+        """
+        deadline = time.monotonic() + timeout
+        with self.replies_lock:
+            condition = self.replies_conditions.setdefault(chat_id, threading.Condition(self.replies_lock))
+            while True:
+                for method, result in self.replies[chat_id][replies_number:]:
+                    if method in REPLY_METHODS and result.get('text') != FEEDBACK_TEXT:
+                        return result
+                replies_number = len(self.replies[chat_id])
+                remaining_time = deadline - time.monotonic()
+                if remaining_time <= 0:
+                    return None
+                condition.wait(remaining_time)
+
+    def record_reply(self, chat_id, method, result):
+        with self.replies_lock:
+            self.replies[chat_id].append((method, result))
+            condition = self.replies_conditions.get(chat_id)
+            if condition:
+                condition.notify_all()
+
+    def make_message(self, chat_id, from_id, **content):
+        return {
+            'message_id': next(self.message_ids),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': get_user(from_id),
+            **content
+        }
+
+    def handle(self, method, path, params):
+        token, _, api_method = path[len('/bot'):].partition('/')
+        if not path.startswith('/bot') or token not in self.updates:
+            return 404, {'ok': False, 'error_code': 404, 'description': 'Not Found'}
+        return 200, {'ok': True, 'result': self.call_api_method(token, api_method, params)}
+
+    def call_api_method(self, token, api_method, params):
+        if api_method == 'getMe':
+            return {'id': BOT_ID, 'is_bot': True, 'first_name': 'Load test', 'username': 'load_test_bot'}
+        if api_method == 'getUpdates':
+            return self.get_updates(token, int(params.get('offset') or 0), float(params.get('timeout') or 0))
+        if api_method == 'answerCallbackQuery':
+            with self.replies_lock:
+                chat_id = self.callback_query_chats.pop(params['callback_query_id'], None)
+            if chat_id:
+                self.record_reply(chat_id, api_method, params)
+            return True
+
+        chat_id = int(params['chat_id']) if 'chat_id' in params else None
+        if api_method in ('sendMessage', 'sendPhoto', 'sendLocation', 'sendInvoice', 'editMessageText'):
+            content = {}
+            if 'reply_markup' in params:
+                content['reply_markup'] = json.loads(params['reply_markup'])
+            if api_method == 'sendMessage':
+                content['text'] = params['text']
+            elif api_method == 'sendPhoto':
+                content['photo'] = [{'file_id': params['photo'], 'file_unique_id': params['photo'], 'width': 1,
+                                     'height': 1}]
+                content['caption'] = params.get('caption')
+            elif api_method == 'sendLocation':
+                content['location'] = {'latitude': float(params['latitude']),
+                                       'longitude': float(params['longitude'])}
+            elif api_method == 'sendInvoice':
+                content['invoice'] = {'title': params['title'], 'description': params['description'],
+                                      'start_parameter': params['start_parameter'], 'currency': params['currency'],
+                                      'total_amount': sum(price['amount'] for price in json.loads(params['prices']))}
+                content['prices'] = json.loads(params['prices'])
+            message = self.make_message(chat_id, BOT_ID, **content)
+            if api_method == 'editMessageText':
+                message['message_id'] = int(params['message_id'])
+                message['text'] = params['text']
+            self.record_reply(chat_id, api_method, message)
+            return message
+        return True
+
+    def get_updates(self, token, offset, timeout):
+        deadline = time.monotonic() + timeout
+        with self.updates_condition:
+            # Апдейты до offset бот уже получил, как и в Bot API они больше не отдаются
+            updates = self.updates[token]
+            updates[:] = [update for update in updates if update['update_id'] >= offset]
+            while not updates and time.monotonic() < deadline:
+                self.updates_condition.wait(deadline - time.monotonic())
+            return updates[:100]
+
+
+def get_user(user_id):
+    return {'id': user_id, 'is_bot': user_id == BOT_ID, 'first_name': f'User {user_id}'}
+
+
+class ElasticPathStub:
+    """Заглушка API Elastic Path с каталогом из menu.json и пиццериями из addresses.json.
+
+    Каждый ответ задерживается на latency секунд, чтобы время обработки апдейта было похоже на настоящее.
+    Заглушка считает запросы, чтобы было видно, не упёрся ли прогон в лимит запросов к Elastic Path.
+
+    Args:
+        menu_file_path (str): путь к menu.json
+        addresses_file_path (str): путь к addresses.json
+        latency (float): задержка ответа в секундах
+    """
+
+    def __init__(self, menu_file_path, addresses_file_path, latency):
+        self.latency = latency
+        self.products = {}
+        for product in open_json_file(menu_file_path):
+            product_id = str(uuid.uuid5(uuid.NAMESPACE_OID, str(product['id'])))
+            self.products[product_id] = {
+                'id': product_id,
+                'name': product['name'],
+                'description': product['description'],
+                'price': [{'amount': product['price'] * 100, 'currency': 'RUB', 'includes_tax': True}],
+                'relationships': {'main_image': {'data': {'id': product_id, 'type': 'main_image'}}},
+            }
+        self.entries = defaultdict(dict)
+        for pizzeria in open_json_file(addresses_file_path):
+            self.entries['Pizzeria'][pizzeria['id']] = {
+                'id': pizzeria['id'],
+                'Alias': pizzeria['alias'],
+                'Address': pizzeria['address']['full'],
+                'Latitude': pizzeria['coordinates']['lat'],
+                'Longitude': pizzeria['coordinates']['lon'],
+                'Deliver_telegram_id': COURIER_CHAT_ID,
+            }
+        self.carts = defaultdict(dict)
+        self.lock = threading.Lock()
+        self.url = None
+        self.requests_number = 0
+
+    def handle(self, method, path, params):
+        time.sleep(self.latency)
+        parts = path.strip('/').split('/')
+        with self.lock:
+            self.requests_number += 1
+            if parts == ['oauth', 'access_token']:
+                return 200, {'access_token': 'load-test', 'token_type': 'Bearer', 'expires_in': 3600}
+            if parts == ['v2', 'products']:
+                return 200, {'data': list(self.products.values())}
+            if parts[:2] == ['v2', 'products'] and parts[2] in self.products:
+                return 200, {'data': self.products[parts[2]]}
+            if parts[:2] == ['v2', 'files']:
+                return 200, {'data': {'id': parts[2], 'link': {'href': f'https://example.com/{parts[2]}.jpg'}}}
+            if parts[:2] == ['v2', 'flows'] and len(parts) == 4 and method == 'GET':
+                return 200, self.get_entries_page(parts[2], int(params.get('page[offset]', 0)))
+            if parts[:2] == ['v2', 'flows'] and len(parts) == 4 and method == 'POST':
+                entry = {**params['data'], 'id': str(uuid.uuid4())}
+                self.entries[parts[2]][entry['id']] = entry
+                return 201, {'data': entry}
+            if parts[:2] == ['v2', 'flows'] and len(parts) == 5 and parts[4] in self.entries[parts[2]]:
+                return 200, {'data': self.entries[parts[2]][parts[4]]}
+            if parts[:2] == ['v2', 'carts'] and len(parts) == 3:
+                return 200, {'data': {'id': parts[2], 'type': 'cart'}}
+            if parts[:2] == ['v2', 'carts'] and parts[3:] == ['items'] and method == 'GET':
+                return 200, {'data': list(self.carts[parts[2]].values())}
+            if parts[:2] == ['v2', 'carts'] and parts[3:] == ['items'] and method == 'POST':
+                cart_items = params['data'] if isinstance(params['data'], list) else [params['data']]
+                for cart_item in cart_items:
+                    self.add_cart_item(parts[2], cart_item['id'], cart_item['quantity'])
+                return 201, {'data': list(self.carts[parts[2]].values())}
+            if parts[:2] == ['v2', 'carts'] and len(parts) == 5 and method == 'DELETE':
+                self.carts[parts[2]].pop(parts[4], None)
+                return 200, {'data': list(self.carts[parts[2]].values())}
+        return 404, {'errors': [{'status': 404, 'title': 'Not Found'}]}
+
+    def get_entries_page(self, flow_slug, offset):
+        entries = list(self.entries[flow_slug].values())
+        pages_number = max(1, -(-len(entries) // ENTRIES_PAGE_LIMIT))
+        return {
+            'data': entries[offset:offset + ENTRIES_PAGE_LIMIT],
+            'meta': {'page': {'current': offset // ENTRIES_PAGE_LIMIT + 1, 'total': pages_number}},
+            'links': {'next': f'{self.url}/v2/flows/{flow_slug}/entries?page[offset]={offset + ENTRIES_PAGE_LIMIT}'},
+        }
+
+    def add_cart_item(self, reference, product_id, quantity):
+        product = self.products[product_id]
+        for cart_item in self.carts[reference].values():
+            if cart_item['product_id'] == product_id:
+                cart_item['quantity'] += quantity
+                return
+        cart_item_id = str(uuid.uuid4())
+        self.carts[reference][cart_item_id] = {'id': cart_item_id, 'type': 'cart_item', 'product_id': product_id,
+                                               'name': product['name'], 'quantity': quantity}
+
+
+class ConsistencyViolation(Exception):
+    pass
+
+
+class SimulatedUser:
+    """Пользователь, который проходит диалог от /start до HANDLE_FINISH.
+
+    После каждого шага проверяется, что бот ответил, а в Redis записано ожидаемое состояние чата
+    и корзина. Первое расхождение прерывает диалог и записывается как нарушение согласованности.
+
+    Args:
+        telegram_stub (:class:`TelegramStub`): заглушка Bot API
+        crm_stub (:class:`ElasticPathStub`): заглушка Elastic Path
+        db (:class:`redis.Redis`): Redis client object
+        chat_id (int): id чата пользователя
+    """
+
+    def __init__(self, telegram_stub, crm_stub, db, chat_id):
+        self.telegram_stub = telegram_stub
+        self.crm_stub = crm_stub
+        self.db = db
+        self.chat_id = chat_id
+        self.latencies = []
+
+    def run(self):
+        """Проходит диалог.
+
+        Returns:
+            str: описание нарушения или None, если диалог пройден
+        """
+        try:
+            self.order_pizza()
+        except ConsistencyViolation as e:
+            return str(e)
+
+    def order_pizza(self):
+        menu = self.send_message('START', 'HANDLE_MENU', text='/start',
+                                 entities=[{'type': 'bot_command', 'offset': 0, 'length': len('/start')}])
+        products_ids = [button['callback_data'] for row in menu['reply_markup']['inline_keyboard'] for button in row
+                        if button.get('callback_data') in self.crm_stub.products]
+        product_id = random.choice(products_ids)
+        product_card = self.press_button('HANDLE_MENU', 'HANDLE_DESCRIPTION', menu, product_id)
+
+        quantity = random.randint(1, 3)
+        self.press_button('HANDLE_DESCRIPTION', 'HANDLE_DESCRIPTION', product_card, f'{product_id},{quantity}')
+        saved_quantity = self.db.hget(get_cart_key(self.chat_id), product_id)
+        if int(saved_quantity or 0) != quantity:
+            raise ConsistencyViolation(f'HANDLE_DESCRIPTION: в корзине {saved_quantity} шт. вместо {quantity}')
+
+        cart_message = self.press_button('HANDLE_DESCRIPTION', 'HANDLE_CART_EDIT', product_card, 'cart')
+        if f'{quantity} шт.' not in cart_message.get('text', ''):
+            raise ConsistencyViolation('HANDLE_CART_EDIT: в тексте корзины нет добавленного товара')
+
+        self.press_button('HANDLE_CART_EDIT', 'HANDLE_LOCATION', cart_message, 'payment')
+        pizzeria = random.choice(list(self.crm_stub.entries['Pizzeria'].values()))
+        location = {'latitude': float(pizzeria['Latitude']) + random.uniform(-0.05, 0.05),
+                    'longitude': float(pizzeria['Longitude']) + random.uniform(-0.05, 0.05)}
+        delivery_options = self.send_message('HANDLE_LOCATION', 'HANDLE_NEW_ORDER', location=location)
+
+        payment_offer = self.press_button('HANDLE_NEW_ORDER', 'HANDLE_WAITING_PAYMENT', delivery_options, 'delivery')
+        invoice = self.press_button('HANDLE_WAITING_PAYMENT', 'HANDLE_FINISH', payment_offer, 'payment')
+        product_price = self.crm_stub.products[product_id]['price'][0]['amount']
+        if invoice.get('prices', [{}])[0].get('amount') != product_price * quantity:
+            raise ConsistencyViolation('HANDLE_WAITING_PAYMENT: сумма счёта не совпадает с корзиной')
+
+        self.send_message('HANDLE_FINISH', 'HANDLE_FINISH', text='Спасибо')
+
+    def send_message(self, state, next_state, **content):
+        return self.make_step(state, next_state, self.telegram_stub.send_message, self.chat_id, **content)
+
+    def press_button(self, state, next_state, message, callback_data):
+        return self.make_step(state, next_state, self.telegram_stub.press_button, self.chat_id, message,
+                              callback_data)
+
+    def make_step(self, state, next_state, send_update, *args, **kwargs):
+        replies_number = self.telegram_stub.get_replies_number(self.chat_id)
+        started_at = time.monotonic()
+        send_update(*args, **kwargs)
+        reply = self.telegram_stub.wait_reply(self.chat_id, replies_number)
+        if reply is None:
+            raise ConsistencyViolation(f'{state}: нет ответа бота')
+        self.latencies.append(time.monotonic() - started_at)
+        if reply.get('text') == STORE_UNAVAILABLE_TEXT:
+            raise ConsistencyViolation(f'{state}: магазин недоступен')
+        self.wait_state(state, next_state)
+        return reply
+
+    def wait_state(self, state, next_state):
+        # Состояние записывается в Redis после ответа бота, поэтому его приходится подождать
+        deadline = time.monotonic() + STATE_TIMEOUT
+        while True:
+            saved_state = self.db.get(self.chat_id)
+            if saved_state == next_state.encode('utf-8'):
+                return
+            if time.monotonic() > deadline:
+                raise ConsistencyViolation(f'{state}: в Redis состояние {saved_state} вместо {next_state}')
+            time.sleep(0.01)
+
+
+def start_replicas(replicas_number, telegram_api_url, crm_api_url, crm_rate_limit, logs_dir):
+    """Запускает реплики bot.py, каждая со своим токеном, и ждёт их готовности по READINESS_FILE.
+
+    Все реплики берут токены из одного ведра лимита запросов в Redis, поэтому лимит crm_rate_limit
+    задаётся на все реплики сразу и должен быть заведомо выше того, что они могут потратить.
+
+    Returns:
+        list: процессы реплик
+    """
+    replicas = []
+    readiness_files_paths = []
+    for replica_number in range(replicas_number):
+        readiness_file_path = os.path.join(logs_dir, f'bot-{replica_number}.ready')
+        readiness_files_paths.append(readiness_file_path)
+        env = {
+            **os.environ,
+            'TELEGRAM_TOKEN': get_replica_token(replica_number),
+            'TELEGRAM_API_URL': f'{telegram_api_url}/bot',
+            'STORE_API_URL': crm_api_url,
+            'STORE_CLIENT_ID': STORE_CLIENT_ID,
+            'STORE_CLIENT_SECRET': 'load-test',
+            'STORE_REQUESTS_PER_SECOND': str(crm_rate_limit),
+            'STORE_REQUESTS_BURST': str(max(1, int(crm_rate_limit))),
+            'STORES': '',
+            'STORE_NAME': 'default',
+            'YANDEX_GEOCODER_TOKEN': 'load-test',
+            'BANK_TOKEN': 'load-test',
+            'READINESS_FILE': readiness_file_path,
+        }
+        with open(os.path.join(logs_dir, f'bot-{replica_number}.log'), 'w') as log_file:
+            replicas.append(subprocess.Popen([sys.executable, 'bot.py'], env=env, stdout=log_file,
+                                             stderr=subprocess.STDOUT, cwd=os.path.dirname(os.path.abspath(__file__))))
+
+    deadline = time.monotonic() + READINESS_TIMEOUT
+    for replica_number, (replica, readiness_file_path) in enumerate(zip(replicas, readiness_files_paths)):
+        while not os.path.exists(readiness_file_path):
+            if replica.poll() is not None or time.monotonic() > deadline:
+                stop_replicas(replicas)
+                raise RuntimeError(f'Реплика {replica_number} не запустилась, см. {logs_dir}/bot-{replica_number}.log')
+            time.sleep(0.1)
+    return replicas
+
+
+def stop_replicas(replicas):
+    for replica in replicas:
+        replica.terminate()
+    for replica in replicas:
+        try:
+            replica.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            replica.kill()
+
+
+def delete_chats(db, chat_ids):
+    """Удаляет из Redis состояния и корзины симулированных пользователей, чтобы их не задела рассылка."""
+    pipe = db.pipeline()
+    for chat_id in chat_ids:
+        pipe.delete(chat_id, get_cart_key(chat_id), get_synced_flag_key(chat_id), get_pending_operations_key(chat_id),
+                    get_chat_store_key(chat_id), get_message_fingerprint_key(chat_id))
+    pipe.execute()
+
+
+def get_percentile(sorted_values, percent):
+    if not sorted_values:
+        return 0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * percent / 100))]
+
+
+def run_load_test(db, replicas_number, users_number, concurrency, routing, crm_stub, crm_rate_limit, first_chat_id,
+                  logs_dir):
+    """Прогоняет users_number симулированных пользователей через replicas_number реплик бота.
+
+    Returns:
+        dict: пропускная способность, запросы к Elastic Path, задержки ответа бота и нарушения согласованности
+    """
+    tokens = [get_replica_token(replica_number) for replica_number in range(replicas_number)]
+    telegram_stub = TelegramStub(tokens, routing)
+    telegram_server, telegram_api_url = start_stub_server(telegram_stub)
+    chat_ids = range(first_chat_id, first_chat_id + users_number)
+    replicas_logs_dir = os.path.join(logs_dir, f'replicas-{replicas_number}')
+    os.makedirs(replicas_logs_dir)
+    # Ведро прошлого прогона могло остаться пустым или на паузе
+    db.delete(get_rate_limit_key(STORE_CLIENT_ID))
+    replicas = start_replicas(replicas_number, telegram_api_url, crm_stub.url, crm_rate_limit, replicas_logs_dir)
+    try:
+        logger.info(f'Запущено реплик: {replicas_number}, пользователей: {users_number}')
+        users = [SimulatedUser(telegram_stub, crm_stub, db, chat_id) for chat_id in chat_ids]
+        crm_requests_number = crm_stub.requests_number
+        started_at = time.monotonic()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            violations = list(executor.map(SimulatedUser.run, users))
+        duration = time.monotonic() - started_at
+        crm_requests_number = crm_stub.requests_number - crm_requests_number
+    finally:
+        stop_replicas(replicas)
+        telegram_server.shutdown()
+        delete_chats(db, chat_ids)
+
+    latencies = sorted(latency for user in users for latency in user.latencies)
+    violations = [violation for violation in violations if violation]
+    return {
+        'replicas_number': replicas_number,
+        'updates_per_second': len(latencies) / duration,
+        'orders_per_second': (users_number - len(violations)) / duration,
+        'crm_requests_per_second': crm_requests_number / duration,
+        'p50': get_percentile(latencies, 50),
+        'p95': get_percentile(latencies, 95),
+        'p99': get_percentile(latencies, 99),
+        'violations_number': len(violations),
+        'violations': Counter(violations),
+    }
+
+
+def main():
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description='Нагрузочный тест нескольких реплик бота с общим Redis')
+    parser.add_argument('--replicas', type=int, nargs='+', default=[1, 2, 4], help='числа реплик для прогонов')
+    parser.add_argument('--users', type=int, default=1000, help='число симулированных пользователей в прогоне')
+    parser.add_argument('--concurrency', type=int, default=100, help='сколько пользователей ведут диалог одновременно')
+    parser.add_argument('--routing', choices=['sticky', 'round-robin'], default='sticky',
+                        help='как апдейты чата распределяются между репликами')
+    parser.add_argument('--crm-latency', type=float, default=0.05, help='задержка ответа Elastic Path в секундах')
+    parser.add_argument('--crm-rate-limit', type=float, default=1000,
+                        help='лимит запросов к Elastic Path в секунду, общий для всех реплик')
+    args = parser.parse_args()
+
+    db = get_database_connection()
+    crm_stub = ElasticPathStub('menu.json', 'addresses.json', args.crm_latency)
+    crm_server, crm_stub.url = start_stub_server(crm_stub)
+    first_chat_id = FIRST_CHAT_ID + random.randrange(10 ** 9)
+    logs_dir = tempfile.mkdtemp(prefix='load-test-')
+    logger.info(f'Логи реплик: {logs_dir}')
+    results = []
+    for replicas_number in args.replicas:
+        results.append(run_load_test(db, replicas_number, args.users, args.concurrency, args.routing, crm_stub,
+                                     args.crm_rate_limit, first_chat_id, logs_dir))
+        first_chat_id += args.users
+    crm_server.shutdown()
+
+    base_updates_per_second = results[0]['updates_per_second']
+    logger.info(f'Маршрутизация апдейтов: {args.routing}')
+    logger.info(f'Лимит запросов к Elastic Path: {args.crm_rate_limit:g} в секунду на все реплики')
+    logger.info('реплик | апдейтов/с | масштаб | заказов/с | запросов к CRM/с |  p50, с |  p95, с |  p99, с | '
+                'нарушений')
+    for result in results:
+        scaling = result['updates_per_second'] / base_updates_per_second if base_updates_per_second else 0
+        logger.info(f"{result['replicas_number']:6} | {result['updates_per_second']:10.1f} | {scaling:6.2f}x | "
+                    f"{result['orders_per_second']:9.1f} | {result['crm_requests_per_second']:16.1f} | "
+                    f"{result['p50']:7.3f} | {result['p95']:7.3f} | {result['p99']:7.3f} | "
+                    f"{result['violations_number']:9}")
+        if result['crm_requests_per_second'] >= RATE_LIMIT_SATURATION * args.crm_rate_limit:
+            logger.warning(f"Реплик: {result['replicas_number']} — прогон упёрся в лимит запросов к Elastic Path, "
+                           f"масштаб занижен: увеличьте --crm-rate-limit")
+        for violation, violations_number in result['violations'].most_common(5):
+            logger.info(f'    {violations_number} × {violation}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+import json
+from dataclasses import dataclass
+
+
+class CompactModel:
+    """Модель с компактной сериализацией: в Redis хранится только список значений полей."""
+    __slots__ = ()
+
+    def to_json(self):
+        values = [getattr(self, field_name) for field_name in self.__slots__]
+        return json.dumps(values, ensure_ascii=False, separators=(',', ':'))
+
+    @classmethod
+    def from_json(cls, serialized_model):
+        return cls(*json.loads(serialized_model))
+
+
+@dataclass(frozen=True)
+class Product(CompactModel):
+    __slots__ = ('id', 'name', 'description', 'price', 'image_id')
+    id: str
+    name: str
+    description: str
+    price: int
+    image_id: str
+
+    @classmethod
+    def from_api(cls, product):
+        main_image = product.get('relationships', {}).get('main_image')
+        image_id = main_image['data']['id'] if main_image else None
+        return cls(product['id'], product['name'], product['description'], product['price'][0]['amount'], image_id)
+
+
+@dataclass(frozen=True)
+class CartItem(CompactModel):
+    __slots__ = ('product_id', 'name', 'description', 'quantity', 'unit_price')
+    product_id: str
+    name: str
+    description: str
+    quantity: int
+    unit_price: int
+
+    @property
+    def value(self):
+        return self.unit_price * self.quantity
+
+
+@dataclass(frozen=True)
+class Cart:
+    __slots__ = ('items',)
+    items: tuple
+
+    @property
+    def total(self):
+        return sum(cart_item.value for cart_item in self.items)
+
+
+@dataclass(frozen=True)
+class Pizzeria(CompactModel):
+    __slots__ = ('id', 'alias', 'address', 'latitude', 'longitude', 'deliver_telegram_id')
+    id: str
+    alias: str
+    address: str
+    latitude: float
+    longitude: float
+    deliver_telegram_id: str
+
+    @property
+    def position(self):
+        return self.latitude, self.longitude
+
+    @classmethod
+    def from_api(cls, entry):
+        return cls(entry['id'], entry['Alias'], entry['Address'], float(entry['Latitude']),
+                   float(entry['Longitude']), entry.get('Deliver_telegram_id'))
+
+
+@dataclass(frozen=True)
+class CustomerAddress(CompactModel):
+    __slots__ = ('id', 'chat_id', 'latitude', 'longitude')
+    id: str
+    chat_id: str
+    latitude: float
+    longitude: float
+
+    @classmethod
+    def from_api(cls, entry):
+        return cls(entry['id'], entry['Customer_chat_id'], float(entry['Latitude']), float(entry['Longitude']))
+
+
+@dataclass(frozen=True)
+class DeliveryQuote(CompactModel):
+    __slots__ = ('pizzeria_id', 'distance', 'delivery_cost', 'message_text')
+    pizzeria_id: str
+    distance: int
+    delivery_cost: int
+    message_text: str
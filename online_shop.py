@@ -1,19 +1,272 @@
 import logging
 import os
+import threading
 import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
 from functools import wraps
+from urllib.parse import urlsplit
 
 import requests
+from requests.adapters import HTTPAdapter
+
+import tracing
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from models import CustomerAddress, Pizzeria, Product
+from rate_limiter import BULK_PRIORITY, INTERACTIVE_PRIORITY, RateLimiter, RateLimitTimeoutError, RedisTokenBucket
 
 logger = logging.getLogger(__name__)
-_token = None
-_headers = None
+CART_REQUESTS_WORKERS_NUMBER = 4
+CONNECTIONS_POOL_SIZE = 16
+THROTTLED_REQUEST_RETRIES_NUMBER = 3
+DEFAULT_RETRY_AFTER = 1
+DEFAULT_STORE_NAME = 'default'
+DEFAULT_API_URL = 'https://api.moltin.com'
+# Таймауты на соединение и на ответ, чтобы медленный магазин не занимал потоки бота
+REQUEST_TIMEOUT = (3.05, 10)
+# Сколько запрос бота может ждать своей очереди у ограничителя, прежде чем магазин считается недоступным
+INTERACTIVE_REQUEST_MAX_WAIT = REQUEST_TIMEOUT[1]
+# Ошибки запросов к магазину; какие из них значат его недоступность, решает is_store_unavailable
+REQUEST_ERRORS = (CircuitOpenError, RateLimitTimeoutError, requests.RequestException)
+# Соединения с API общие для всех магазинов, а токены, лимиты и кэши у каждого магазина свои
+_session = requests.Session()
+_adapter = HTTPAdapter(pool_connections=CONNECTIONS_POOL_SIZE, pool_maxsize=CONNECTIONS_POOL_SIZE)
+_session.mount('https://', _adapter)
+_session.mount('http://', _adapter)
+_request_priority = threading.local()
+_current_store = threading.local()
+_clients = {}
+_clients_lock = threading.Lock()
+_rate_limits_database = None
+
+
+class StoreClient:
+    """Клиент одного магазина Elastic Path: ключи доступа, токен, ограничитель запросов и кэши.
+
+    Args:
+        name (str): название магазина
+        client_id (str): client_id магазина
+        client_secret (str): client_secret магазина
+        api_url (str): адрес API магазина
+        requests_per_second (float): разрешённое магазином число запросов в секунду
+        burst (int): максимальное число запросов, которое можно выполнить разом
+    """
+
+    def __init__(self, name, client_id, client_secret, api_url=DEFAULT_API_URL, requests_per_second=20, burst=20):
+        self.name = name
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.api_url = api_url
+        self.token = None
+        self.headers = None
+        self.requests_per_second = requests_per_second
+        self.burst = burst
+        token_bucket = None
+        if _rate_limits_database is not None:
+            token_bucket = RedisTokenBucket(_rate_limits_database, get_rate_limit_key(client_id), requests_per_second,
+                                            burst)
+        self.rate_limiter = RateLimiter(requests_per_second, burst, CONNECTIONS_POOL_SIZE, token_bucket=token_bucket)
+        self.caches = {}
+        self.is_bulk_add_supported = True
+        self.circuit_breakers = {}
+        self.circuit_breakers_lock = threading.Lock()
+
+    def get_circuit_breaker(self, method, url):
+        """Размыкатель эндпоинта: метода и первых двух частей пути, например GET /v2/carts."""
+        path_parts = urlsplit(url).path.strip('/').split('/')
+        endpoint = f'{method.upper()} /{"/".join(path_parts[:2])}'
+        with self.circuit_breakers_lock:
+            if endpoint not in self.circuit_breakers:
+                self.circuit_breakers[endpoint] = CircuitBreaker(f'{self.name}: {endpoint}')
+            return self.circuit_breakers[endpoint]
+
+    @classmethod
+    def from_env(cls, name):
+        """Создаёт клиент по переменным окружения.
+
+        Для магазина по умолчанию используются STORE_CLIENT_ID, STORE_CLIENT_SECRET и т.д.,
+        для остальных — те же переменные с названием магазина: STORE_SPB_CLIENT_ID, STORE_SPB_CLIENT_SECRET.
+        """
+        prefix = get_env_prefix(name)
+        return cls(
+            name=name,
+            client_id=os.environ[f'{prefix}CLIENT_ID'],
+            client_secret=os.environ[f'{prefix}CLIENT_SECRET'],
+            api_url=os.getenv(f'{prefix}API_URL', DEFAULT_API_URL),
+            requests_per_second=float(os.getenv(f'{prefix}REQUESTS_PER_SECOND', 20)),
+            burst=int(os.getenv(f'{prefix}REQUESTS_BURST', 20))
+        )
+
+
+def get_rate_limit_key(client_id):
+    return f'rate-limit:{client_id}'
+
+
+def get_env_prefix(store_name):
+    return 'STORE_' if store_name == DEFAULT_STORE_NAME else f'STORE_{store_name.upper()}_'
+
+
+def get_store_names():
+    """Названия магазинов: магазин по умолчанию и перечисленные через запятую в переменной STORES."""
+    store_names = [store_name.strip() for store_name in os.getenv('STORES', '').split(',') if store_name.strip()]
+    return [DEFAULT_STORE_NAME, *store_names]
+
+
+def is_store_configured(store_name):
+    """Магазин есть в списке магазинов и для него заданы ключи доступа."""
+    prefix = get_env_prefix(store_name)
+    return (store_name in get_store_names() and f'{prefix}CLIENT_ID' in os.environ
+            and f'{prefix}CLIENT_SECRET' in os.environ)
+
+
+def share_rate_limits(db):
+    """Делит лимиты запросов магазинов между всеми процессами, подключёнными к этому Redis.
+
+    Бот, его реплики, shop_data.py и export_addresses.py берут токены из общего ведра магазина,
+    поэтому вместе не превышают его лимит, а часть лимита остаётся за запросами бота.
+
+    Args:
+        db (:class:`redis.Redis`): Redis client object
+    """
+    global _rate_limits_database
+    _rate_limits_database = db
+    with _clients_lock:
+        for client in _clients.values():
+            client.rate_limiter.token_bucket = RedisTokenBucket(db, get_rate_limit_key(client.client_id),
+                                                                client.requests_per_second, client.burst)
+
+
+def register_store(client):
+    with _clients_lock:
+        _clients[client.name] = client
+
+
+def get_current_store_name():
+    return getattr(_current_store, 'name', DEFAULT_STORE_NAME)
+
+
+def get_client(store_name=None):
+    """Клиент магазина, по умолчанию — выбранного в текущем потоке."""
+    store_name = store_name or get_current_store_name()
+    with _clients_lock:
+        if store_name not in _clients:
+            _clients[store_name] = StoreClient.from_env(store_name)
+        return _clients[store_name]
+
+
+@contextmanager
+def use_store(store_name):
+    """Запросы внутри блока идут в магазин store_name."""
+    previous_store_name = get_current_store_name()
+    _current_store.name = store_name
+    try:
+        yield get_client(store_name)
+    finally:
+        _current_store.name = previous_store_name
+
+
+def run_in_store(store_name, fnc, *args):
+    """Выполняет функцию в магазине store_name, нужно для передачи магазина в другие потоки."""
+    with use_store(store_name):
+        return fnc(*args)
+
+
+def get_url(path):
+    return f'{get_client().api_url}{path}'
+
+
+def get_headers():
+    return get_client().headers
+
+
+@contextmanager
+def bulk_priority():
+    """Запросы внутри блока уступают очередь запросам бота."""
+    previous_priority = getattr(_request_priority, 'value', INTERACTIVE_PRIORITY)
+    _request_priority.value = BULK_PRIORITY
+    try:
+        yield
+    finally:
+        _request_priority.value = previous_priority
+
+
+def is_store_unavailable(error):
+    """Проверяет, что ошибка запроса значит недоступность магазина, а не неверный запрос.
+
+    Магазин недоступен, если открыт размыкатель, запрос бота слишком долго ждал очереди у ограничителя,
+    не удалось соединиться, истёк таймаут или API ответил 5xx.
+    """
+    if isinstance(error, requests.HTTPError):
+        return error.response is not None and error.response.status_code >= 500
+    return isinstance(error, (CircuitOpenError, RateLimitTimeoutError, requests.ConnectionError, requests.Timeout))
+
+
+def parse_retry_after(retry_after):
+    if not retry_after:
+        return DEFAULT_RETRY_AFTER
+    try:
+        return float(retry_after)
+    except ValueError:
+        return max(0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+
+
+def send_request(method, url, **kwargs):
+    """Запрос к API текущего магазина через его ограничитель запросов и размыкатель эндпоинта.
+
+    При ответе 429 Too Many Requests ждёт время из заголовка Retry-After и повторяет запрос,
+    но не больше THROTTLED_REQUEST_RETRIES_NUMBER раз. Запрос с приоритетом INTERACTIVE_PRIORITY ждёт
+    очереди у ограничителя, в том числе после 429, не дольше INTERACTIVE_REQUEST_MAX_WAIT секунд в сумме,
+    чтобы не занимать поток бота. Ошибки соединения, таймауты и ответы 5xx учитываются размыкателем.
+
+    Returns:
+        (:class:`requests.Response`): ответ API
+
+    Raises:
+        (:class:`circuit_breaker.CircuitOpenError`): эндпоинт временно недоступен
+        (:class:`rate_limiter.RateLimitTimeoutError`): запрос бота не дождался очереди у ограничителя
+    """
+    priority = getattr(_request_priority, 'value', INTERACTIVE_PRIORITY)
+    client = get_client()
+    rate_limiter = client.rate_limiter
+    circuit_breaker = client.get_circuit_breaker(method, url)
+    kwargs.setdefault('timeout', REQUEST_TIMEOUT)
+    deadline = None
+    if priority == INTERACTIVE_PRIORITY:
+        deadline = time.monotonic() + INTERACTIVE_REQUEST_MAX_WAIT
+    for _ in range(THROTTLED_REQUEST_RETRIES_NUMBER + 1):
+        circuit_breaker.before_call()
+        rate_limiter.acquire(priority, None if deadline is None else max(0, deadline - time.monotonic()))
+        started_at = time.monotonic()
+        is_throttled = False
+        retry_after = None
+        try:
+            with tracing.span(f'{method.upper()} {urlsplit(url).path}', store=client.name):
+                response = _session.request(method, url, **kwargs)
+        except requests.RequestException:
+            circuit_breaker.record_failure()
+            raise
+        else:
+            if response.status_code >= 500:
+                circuit_breaker.record_failure()
+            else:
+                circuit_breaker.record_success()
+            is_throttled = response.status_code == 429
+            if is_throttled:
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+        finally:
+            rate_limiter.release(time.monotonic() - started_at, is_throttled, retry_after)
+        if not is_throttled:
+            return response
+        logger.warning(f'Превышен лимит запросов к магазину, повторяем {method} {url} через {retry_after} с')
+    return response
 
 
 def validate_access_token(fnc):
     @wraps(fnc)
     def wrapped(*args, **kwargs):
-        if _token['creation_time'] + _token['expires_in'] < time.time():
+        token = get_client().token
+        if not token or token['creation_time'] + token['expires_in'] < time.time():
             logger.info('Срок действия токена истекает. Получаем новый токен')
             get_access_token()
             set_headers()
@@ -23,31 +276,85 @@ def validate_access_token(fnc):
     return wrapped
 
 
+def cache_for(seconds):
+    """Кэширует результат функции в памяти процесса на заданное число секунд, отдельно для каждого магазина.
+
+    Если магазин недоступен, возвращает последний полученный результат, даже устаревший.
+    """
+    def decorator(fnc):
+        @wraps(fnc)
+        def wrapped(*args):
+            cache = get_client().caches.setdefault(fnc.__name__, {})
+            cached = cache.get(args)
+            if cached and cached['expires_at'] > time.time():
+                return cached['value']
+            try:
+                value = fnc(*args)
+            except REQUEST_ERRORS as e:
+                if not cached or not is_store_unavailable(e):
+                    raise
+                logger.warning(f'Магазин недоступен ({e}), отдаём устаревший результат {fnc.__name__}{args}')
+                return cached['value']
+            cache[args] = {'value': value, 'expires_at': time.time() + seconds}
+            return value
+
+        return wrapped
+
+    return decorator
+
+
+def single_flight(fnc):
+    """Объединяет одновременные вызовы функции с одинаковыми аргументами в один запрос.
+
+    Первый вызов выполняет запрос, остальные ждут его и получают тот же результат или то же исключение.
+    """
+    in_flight_calls = {}
+    lock = threading.Lock()
+
+    @wraps(fnc)
+    def wrapped(*args):
+        call_key = (get_current_store_name(), *args)
+        with lock:
+            call = in_flight_calls.get(call_key)
+            is_leader = call is None
+            if is_leader:
+                call = Future()
+                in_flight_calls[call_key] = call
+        if not is_leader:
+            return call.result()
+
+        try:
+            call.set_result(fnc(*args))
+        except Exception as e:
+            call.set_exception(e)
+        finally:
+            with lock:
+                del in_flight_calls[call_key]
+        return call.result()
+
+    return wrapped
+
+
+@cache_for(300)
+@single_flight
 @validate_access_token
 def get_all_products():
     logger.info('Получаем список товаров')
-    response = requests.get('https://api.moltin.com/v2/products', headers=_headers)
+    response = send_request('get', get_url('/v2/products'), headers=get_headers())
     response.raise_for_status()
     review_result = response.json()
-    products_for_menu = []
-    for product in review_result['data']:
-        product_for_menu = {
-            'id': product['id'],
-            'name': product['name'],
-            'description': product['description'],
-            'price': product['price'][0]['amount']
-        }
-        products_for_menu.append(product_for_menu)
-    return products_for_menu
+    return [Product.from_api(product) for product in review_result['data']]
 
 
+@cache_for(300)
+@single_flight
 @validate_access_token
 def get_product(product_id):
     logger.info(f'Получаем товар с id {product_id}')
-    response = requests.get(f'https://api.moltin.com/v2/products/{product_id}', headers=_headers)
+    response = send_request('get', get_url(f'/v2/products/{product_id}'), headers=get_headers())
     response.raise_for_status()
     review_result = response.json()
-    return review_result['data']
+    return Product.from_api(review_result['data'])
 
 
 @validate_access_token
@@ -74,7 +381,7 @@ def create_product(product):
         }
     }
 
-    response = requests.post('https://api.moltin.com/v2/products', headers=_headers, json=data)
+    response = send_request('post', get_url('/v2/products'), headers=get_headers(), json=data)
     response.raise_for_status()
     review_result = response.json()
     return review_result['data']['id']
@@ -84,7 +391,7 @@ def create_product(product):
 def create_file(image_file):
     logger.info(f'Загружаем файл {image_file[0]}')
     files = {'file': image_file}
-    response = requests.post('https://api.moltin.com/v2/files', headers=_headers, files=files)
+    response = send_request('post', get_url('/v2/files'), headers=get_headers(), files=files)
     response.raise_for_status()
     review_result = response.json()
     return review_result['data']['id']
@@ -98,8 +405,8 @@ def create_product_main_image(product_id, image_id):
             'type': 'main_image'
         }
     }
-    response = requests.post(f'https://api.moltin.com/v2/products/{product_id}/relationships/main-image',
-                             headers=_headers, json=data)
+    response = send_request('post', get_url(f'/v2/products/{product_id}/relationships/main-image'),
+                            headers=get_headers(), json=data)
     response.raise_for_status()
     review_result = response.json()
     return review_result['data']
@@ -116,7 +423,7 @@ def create_flow(flow_name, flow_description):
             'enabled': True
         }
     }
-    response = requests.post('https://api.moltin.com/v2/flows', headers=_headers, json=data)
+    response = send_request('post', get_url('/v2/flows'), headers=get_headers(), json=data)
     response.raise_for_status()
     review_result = response.json()
     return review_result['data']['id']
@@ -143,7 +450,7 @@ def create_flow_field(flow_id, field):
             }
         }
     }
-    response = requests.post('https://api.moltin.com/v2/fields', headers=_headers, json=data)
+    response = send_request('post', get_url('/v2/fields'), headers=get_headers(), json=data)
     response.raise_for_status()
     review_result = response.json()
     return review_result['data']['id']
@@ -159,46 +466,72 @@ def create_flow_entry(flow_slug, fields):
     for field_name, field_value in fields.items():
         data['data'][field_name] = field_value
 
-    response = requests.post(f'https://api.moltin.com/v2/flows/{flow_slug}/entries', headers=_headers, json=data)
+    response = send_request('post', get_url(f'/v2/flows/{flow_slug}/entries'), headers=get_headers(), json=data)
     response.raise_for_status()
     review_result = response.json()
     return review_result['data']['id']
 
 
-@validate_access_token
-def get_all_entries(flow_slug, url=None):
+def get_all_entries(flow_slug):
     logger.info(f'Получаем все элементы списка {flow_slug}')
+    return [entry for entries in iter_entries_pages(flow_slug) for entry in entries]
+
+
+def iter_entries_pages(flow_slug):
+    """Постранично отдаёт элементы списка, не загружая весь список в память.
+
+    Args:
+        flow_slug (str): slug flow
+
+    Yields:
+        list: элементы очередной страницы списка
+    """
     entries_per_page_number = 50
     params = {
         'page[limit]': entries_per_page_number
     }
-    if not url:
-        url = f'https://api.moltin.com/v2/flows/{flow_slug}/entries'
-    response = requests.get(url, headers=_headers, params=params)
+    url = get_url(f'/v2/flows/{flow_slug}/entries')
+    while True:
+        review_result = get_entries_page(url, params)
+        yield review_result['data']
+        page = review_result['meta']['page']
+        if page['current'] >= page['total']:
+            break
+        url = review_result['links']['next']
+
+
+@validate_access_token
+def get_entries_page(url, params):
+    response = send_request('get', url, headers=get_headers(), params=params)
     response.raise_for_status()
-    review_result = response.json()
-    entries = review_result['data']
-    page = review_result['meta']['page']
-    next_page = review_result['links']['next']
-    if page['current'] != page['total']:
-        next_entries = get_all_entries(flow_slug, next_page)
-        entries.extend(next_entries)
-    return entries
+    return response.json()
+
+
+@cache_for(600)
+@single_flight
+def get_pizzerias(flow_slug):
+    return [Pizzeria.from_api(entry) for entry in get_all_entries(flow_slug)]
 
 
 @validate_access_token
 def get_entry(flow_slug, entry_id):
     logger.info(f'Получаем элемент списка {flow_slug} с id {entry_id}')
-    response = requests.get(f'https://api.moltin.com/v2/flows/{flow_slug}/entries/{entry_id}', headers=_headers)
+    response = send_request('get', get_url(f'/v2/flows/{flow_slug}/entries/{entry_id}'), headers=get_headers())
     response.raise_for_status()
     review_result = response.json()
     return review_result['data']
 
 
+def get_customer_address(entry_id):
+    return CustomerAddress.from_api(get_entry('Customer_Address', entry_id))
+
+
+@cache_for(3600)
+@single_flight
 @validate_access_token
 def get_file_href(product_id):
     logger.info(f'Получаем ссылку основного изображения товара с id {product_id}')
-    response = requests.get(f'https://api.moltin.com/v2/files/{product_id}', headers=_headers)
+    response = send_request('get', get_url(f'/v2/files/{product_id}'), headers=get_headers())
     response.raise_for_status()
     review_result = response.json()
     return review_result['data']['link']['href']
@@ -206,7 +539,7 @@ def get_file_href(product_id):
 
 @validate_access_token
 def add_product_to_cart(reference, product_id, quantity):
-    headers = {**_headers, 'Content-Type': 'application/json'}
+    headers = {**get_headers(), 'Content-Type': 'application/json'}
 
     data = {
         'data': {
@@ -216,21 +549,96 @@ def add_product_to_cart(reference, product_id, quantity):
         }
     }
     logger.info(f'Добавляем товар с id {product_id} в количестве {quantity} в корзину {reference}')
-    response = requests.post(f'https://api.moltin.com/v2/carts/{reference}/items/', headers=headers, json=data)
+    response = send_request('post', get_url(f'/v2/carts/{reference}/items/'), headers=headers, json=data)
+    response.raise_for_status()
+
+
+@validate_access_token
+def add_products_to_cart(reference, products):
+    """Добавляет в корзину несколько товаров и возвращает её содержимое.
+
+    Товары отправляются одним запросом bulk add. Если магазин его не поддерживает,
+    товары добавляются параллельными запросами, не более CART_REQUESTS_WORKERS_NUMBER одновременно,
+    и в следующий раз bulk add для этого магазина уже не пробуется.
+
+    Args:
+        reference (int): reference корзины
+        products (list): пары (id товара, количество)
+
+    Returns:
+        list: товары корзины
+    """
+    client = get_client()
+    if not client.is_bulk_add_supported:
+        return add_products_to_cart_one_by_one(reference, products)
+
+    headers = {**get_headers(), 'Content-Type': 'application/json'}
+    data = {
+        'data': [
+            {
+                'id': product_id,
+                'type': 'cart_item',
+                'quantity': quantity
+            }
+            for product_id, quantity in products
+        ],
+        'options': {
+            'add_all_or_nothing': False
+        }
+    }
+    logger.info(f'Добавляем товары {products} в корзину {reference}')
+    response = send_request('post', get_url(f'/v2/carts/{reference}/items/'), headers=headers, json=data)
+    if is_bulk_add_unsupported(response):
+        logger.info(f'Магазин {client.name} не поддерживает bulk add, добавляем товары по одному')
+        client.is_bulk_add_supported = False
+        return add_products_to_cart_one_by_one(reference, products)
+
     response.raise_for_status()
+    review_result = response.json()
+    return review_result['data']
+
+
+def is_bulk_add_unsupported(response):
+    """Проверяет, что магазин отклонил сам формат bulk add, а не добавляемые товары.
+
+    Без поддержки bulk add эндпоинт отвечает 405 или ждёт в data один объект и отвечает ошибкой о типе
+    поля data. Ошибки отдельных товаров сюда не относятся: неизвестный товар тоже приходит как 404,
+    и повтор по одному товару упал бы так же.
+    """
+    if response.status_code == 405:
+        return True
+    if response.status_code not in (400, 422):
+        return False
+    try:
+        errors = response.json().get('errors', [])
+    except ValueError:
+        return False
+    return any('expected: object' in str(error.get('detail', '')).lower() for error in errors)
+
+
+def add_products_to_cart_one_by_one(reference, products):
+    with ThreadPoolExecutor(max_workers=CART_REQUESTS_WORKERS_NUMBER) as executor:
+        futures = [
+            executor.submit(run_in_store, get_current_store_name(), add_product_to_cart, reference, product_id,
+                            quantity)
+            for product_id, quantity in products
+        ]
+    for future in futures:
+        future.result()
+    return get_cart_items(reference)
 
 
 @validate_access_token
 def remove_product_from_cart(reference, product_id):
     logger.info(f'Удаляем товар с id {product_id} из корзины {reference}')
-    response = requests.delete(f'https://api.moltin.com/v2/carts/{reference}/items/{product_id}', headers=_headers)
+    response = send_request('delete', get_url(f'/v2/carts/{reference}/items/{product_id}'), headers=get_headers())
     response.raise_for_status()
 
 
 @validate_access_token
 def get_cart(reference):
     logger.info(f'Получаем данные корзины {reference}')
-    response = requests.get(f'https://api.moltin.com/v2/carts/{reference}', headers=_headers)
+    response = send_request('get', get_url(f'/v2/carts/{reference}'), headers=get_headers())
     response.raise_for_status()
     return response.json()
 
@@ -238,7 +646,7 @@ def get_cart(reference):
 @validate_access_token
 def get_cart_items(reference):
     logger.info(f'Получаем товары корзины {reference}')
-    response = requests.get(f'https://api.moltin.com/v2/carts/{reference}/items', headers=_headers)
+    response = send_request('get', get_url(f'/v2/carts/{reference}/items'), headers=get_headers())
     response.raise_for_status()
     review_result = response.json()
     return review_result['data']
@@ -254,28 +662,29 @@ def create_customer(customer_name, customer_email):
         }
     }
     logger.info(f'Создаем покупателя {customer_name}, email: {customer_email}')
-    response = requests.post('https://api.moltin.com/v2/customers', headers=_headers, json=data)
+    response = send_request('post', get_url('/v2/customers'), headers=get_headers(), json=data)
     response.raise_for_status()
 
 
 def get_access_token():
-    logger.info('Получаем токен')
+    client = get_client()
+    logger.info(f'Получаем токен магазина {client.name}')
     payload = {
-        'client_id': os.environ['STORE_CLIENT_ID'],
-        'client_secret': os.environ['STORE_CLIENT_SECRET'],
+        'client_id': client.client_id,
+        'client_secret': client.client_secret,
         'grant_type': 'client_credentials'
     }
 
-    response = requests.post('https://api.moltin.com/oauth/access_token', data=payload)
+    response = send_request('post', get_url('/oauth/access_token'), data=payload)
     response.raise_for_status()
     review_result = response.json()
 
-    global _token
-    _token = review_result
-    _token['expires_in'] = _token['expires_in'] - 10
-    _token['creation_time'] = time.time()
+    token = review_result
+    token['expires_in'] = token['expires_in'] - 10
+    token['creation_time'] = time.time()
+    client.token = token
 
 
 def set_headers():
-    global _headers
-    _headers = {'Authorization': f'Bearer {_token["access_token"]}'}
+    client = get_client()
+    client.headers = {'Authorization': f'Bearer {client.token["access_token"]}'}
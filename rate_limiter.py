@@ -0,0 +1,270 @@
+import threading
+import time
+
+INTERACTIVE_PRIORITY = 0
+BULK_PRIORITY = 1
+# Доля скорости, которую могут тратить только запросы с приоритетом INTERACTIVE_PRIORITY
+INTERACTIVE_SHARE = 0.25
+RESERVED_BUCKET = 'reserved'
+SHARED_BUCKET = 'shared'
+SHARED_STATE_TTL = 60
+# Тот же расчёт, что в TokenBucket._take и TokenBucket._pause, одной атомарной командой Redis.
+# Время передаётся из процесса, поэтому refilled_at не сдвигается назад из-за расхождения часов реплик.
+TOKEN_BUCKET_SCRIPT = '''
+local now = tonumber(ARGV[1])
+local operation = ARGV[2]
+local argument = tonumber(ARGV[3])
+local rates = {reserved = tonumber(ARGV[4]), shared = tonumber(ARGV[5])}
+local capacities = {reserved = tonumber(ARGV[6]), shared = tonumber(ARGV[7])}
+local interactive_priority = tonumber(ARGV[8])
+local ttl = tonumber(ARGV[9])
+
+local saved_state = redis.call('HMGET', KEYS[1], 'reserved', 'shared', 'refilled_at', 'paused_until')
+local state = {reserved = capacities.reserved, shared = capacities.shared}
+local refilled_at = now
+local paused_until = 0
+if saved_state[3] then
+    local elapsed_time = math.max(0, now - tonumber(saved_state[3]))
+    state.reserved = math.min(capacities.reserved, tonumber(saved_state[1]) + elapsed_time * rates.reserved)
+    state.shared = math.min(capacities.shared, tonumber(saved_state[2]) + elapsed_time * rates.shared)
+    refilled_at = math.max(now, tonumber(saved_state[3]))
+    paused_until = tonumber(saved_state[4])
+end
+
+local buckets = {'shared'}
+if argument == interactive_priority then
+    buckets = {'reserved', 'shared'}
+end
+local wait_time = 0
+if operation == 'pause' then
+    state.reserved = math.min(state.reserved, 0)
+    state.shared = math.min(state.shared, 0)
+    paused_until = math.max(paused_until, now + argument)
+elseif now < paused_until then
+    wait_time = paused_until - now
+else
+    wait_time = nil
+    for _, bucket in ipairs(buckets) do
+        if state[bucket] >= 1 then
+            state[bucket] = state[bucket] - 1
+            wait_time = 0
+            break
+        end
+    end
+    if wait_time == nil then
+        for _, bucket in ipairs(buckets) do
+            if rates[bucket] > 0 then
+                local bucket_wait_time = (1 - state[bucket]) / rates[bucket]
+                wait_time = math.min(wait_time or bucket_wait_time, bucket_wait_time)
+            end
+        end
+    end
+end
+
+redis.call('HSET', KEYS[1], 'reserved', tostring(state.reserved), 'shared', tostring(state.shared),
+    'refilled_at', tostring(refilled_at), 'paused_until', tostring(paused_until))
+redis.call('EXPIRE', KEYS[1], ttl)
+return tostring(wait_time)
+'''
+
+
+class RateLimitTimeoutError(Exception):
+    """Запрос не отправлен, потому что очередь ограничителя дольше допустимого ожидания."""
+
+
+class TokenBucket:
+    """Token bucket с частью скорости, зарезервированной для запросов бота.
+
+    Скорость делится на два ведра: зарезервированное получает долю interactive_share, общее — остальное.
+    Запросы с приоритетом INTERACTIVE_PRIORITY берут токены из обоих вёдер, BULK_PRIORITY — только
+    из общего, поэтому загрузка данных не может занять всю скорость. Состояние хранится в памяти процесса.
+
+    Args:
+        requests_per_second (float): разрешённое число запросов в секунду
+        burst (int): максимальное число запросов, которое можно выполнить разом
+        interactive_share (float): доля скорости, зарезервированная для запросов бота
+    """
+
+    def __init__(self, requests_per_second, burst, interactive_share=INTERACTIVE_SHARE):
+        self.rates = {
+            RESERVED_BUCKET: requests_per_second * interactive_share,
+            SHARED_BUCKET: requests_per_second * (1 - interactive_share),
+        }
+        self.capacities = {
+            RESERVED_BUCKET: max(1.0, burst * interactive_share),
+            SHARED_BUCKET: max(1.0, burst * (1 - interactive_share)),
+        }
+        self.state = None
+        self._lock = threading.Lock()
+
+    def take(self, priority):
+        """Берёт токен для запроса с заданным приоритетом.
+
+        Returns:
+            float: 0, если токен взят, иначе через сколько секунд попробовать снова
+        """
+        with self._lock:
+            self.state, wait_time = self._take(self.state, priority, time.time())
+            return wait_time
+
+    def pause(self, seconds):
+        """Останавливает выдачу токенов на seconds секунд, например после ответа 429."""
+        with self._lock:
+            self.state = self._pause(self.state, seconds, time.time())
+
+    def _refill(self, state, now):
+        if state is None:
+            return {**self.capacities, 'refilled_at': now, 'paused_until': 0.0}
+        elapsed_time = max(0.0, now - state['refilled_at'])
+        refilled_state = {
+            bucket: min(capacity, state[bucket] + elapsed_time * self.rates[bucket])
+            for bucket, capacity in self.capacities.items()
+        }
+        return {**refilled_state, 'refilled_at': now, 'paused_until': state['paused_until']}
+
+    def _take(self, state, priority, now):
+        state = self._refill(state, now)
+        if now < state['paused_until']:
+            return state, state['paused_until'] - now
+        buckets = (RESERVED_BUCKET, SHARED_BUCKET) if priority == INTERACTIVE_PRIORITY else (SHARED_BUCKET,)
+        for bucket in buckets:
+            if state[bucket] >= 1:
+                state[bucket] -= 1
+                return state, 0
+        return state, min((1 - state[bucket]) / self.rates[bucket] for bucket in buckets if self.rates[bucket] > 0)
+
+    def _pause(self, state, seconds, now):
+        state = self._refill(state, now)
+        state[RESERVED_BUCKET] = min(state[RESERVED_BUCKET], 0.0)
+        state[SHARED_BUCKET] = min(state[SHARED_BUCKET], 0.0)
+        state['paused_until'] = max(state['paused_until'], now + seconds)
+        return state
+
+
+class RedisTokenBucket(TokenBucket):
+    """Token bucket, общий для всех процессов, работающих с одним магазином: бота, его реплик и скриптов.
+
+    Состояние вёдер хранится в хэше Redis и меняется скриптом Lua за одну атомарную команду,
+    поэтому запросы реплик не конфликтуют и не повторяются.
+
+    Args:
+        db (:class:`redis.Redis`): Redis client object
+        key (str): ключ хэша с состоянием вёдер
+        requests_per_second (float): разрешённое число запросов в секунду
+        burst (int): максимальное число запросов, которое можно выполнить разом
+        interactive_share (float): доля скорости, зарезервированная для запросов бота
+    """
+
+    def __init__(self, db, key, requests_per_second, burst, interactive_share=INTERACTIVE_SHARE):
+        super().__init__(requests_per_second, burst, interactive_share)
+        self.key = key
+        self._script = db.register_script(TOKEN_BUCKET_SCRIPT)
+
+    def take(self, priority):
+        return self._run('take', priority)
+
+    def pause(self, seconds):
+        self._run('pause', seconds)
+
+    def _run(self, operation, argument):
+        wait_time = self._script(keys=[self.key], args=[
+            repr(time.time()), operation, argument,
+            self.rates[RESERVED_BUCKET], self.rates[SHARED_BUCKET],
+            self.capacities[RESERVED_BUCKET], self.capacities[SHARED_BUCKET],
+            INTERACTIVE_PRIORITY, SHARED_STATE_TTL,
+        ])
+        return float(wait_time)
+
+
+class RateLimiter:
+    """Ограничитель запросов к API: token bucket и адаптивный лимит одновременных запросов.
+
+    Токены выдаёт token_bucket, по умолчанию — TokenBucket в памяти процесса. Лимит одновременных
+    запросов растёт на единицу за окно успешных запросов и делится пополам при ответе 429 или
+    на 10% при ответе дольше slow_response_time (AIMD). Пока есть ожидающие запросы с приоритетом
+    INTERACTIVE_PRIORITY, запросы с приоритетом BULK_PRIORITY не выполняются.
+
+    Args:
+        requests_per_second (float): разрешённое число запросов в секунду
+        burst (int): максимальное число запросов, которое можно выполнить разом
+        max_concurrency (int): верхняя граница лимита одновременных запросов
+        slow_response_time (float): время ответа в секундах, после которого лимит снижается
+        token_bucket (:class:`TokenBucket`): источник токенов, например общий для процессов RedisTokenBucket
+    """
+
+    def __init__(self, requests_per_second, burst, max_concurrency, slow_response_time=5, token_bucket=None):
+        self.max_concurrency = max_concurrency
+        self.slow_response_time = slow_response_time
+        self.token_bucket = token_bucket or TokenBucket(requests_per_second, burst)
+
+        self.concurrency_limit = float(max_concurrency)
+        self.in_flight_requests_number = 0
+        self.waiting_requests_numbers = {INTERACTIVE_PRIORITY: 0, BULK_PRIORITY: 0}
+        self._condition = threading.Condition()
+
+    def acquire(self, priority=INTERACTIVE_PRIORITY, timeout=None):
+        """Блокирует поток, пока запрос с заданным приоритетом нельзя выполнить.
+
+        Место среди одновременных запросов занимается под блокировкой, а токен берётся уже без неё:
+        общее ведро в Redis не должно задерживать остальные потоки процесса.
+
+        Args:
+            priority (int): INTERACTIVE_PRIORITY или BULK_PRIORITY
+            timeout (float): сколько секунд можно ждать, по умолчанию — сколько потребуется
+
+        Raises:
+            (:class:`RateLimitTimeoutError`): запрос нельзя выполнить за timeout секунд
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            self.waiting_requests_numbers[priority] += 1
+        try:
+            while True:
+                with self._condition:
+                    while not self._has_free_slot(priority):
+                        self._check_deadline(deadline)
+                        self._condition.wait(None if deadline is None else deadline - time.monotonic())
+                    self.in_flight_requests_number += 1
+                wait_time = self.token_bucket.take(priority)
+                if wait_time == 0:
+                    return
+                with self._condition:
+                    self.in_flight_requests_number -= 1
+                    self._condition.notify_all()
+                self._check_deadline(deadline, wait_time)
+                time.sleep(wait_time)
+        finally:
+            with self._condition:
+                self.waiting_requests_numbers[priority] -= 1
+                self._condition.notify_all()
+
+    def release(self, response_time, is_throttled=False, retry_after=None):
+        """Освобождает место выполненного запроса и подстраивает лимит одновременных запросов.
+
+        Args:
+            response_time (float): время ответа в секундах
+            is_throttled (bool): API ответил 429 Too Many Requests
+            retry_after (float): через сколько секунд API разрешил повторить запрос
+        """
+        if is_throttled:
+            self.token_bucket.pause(retry_after or 0)
+        with self._condition:
+            self.in_flight_requests_number -= 1
+            if is_throttled:
+                self.concurrency_limit = max(1.0, self.concurrency_limit / 2)
+            elif response_time > self.slow_response_time:
+                self.concurrency_limit = max(1.0, self.concurrency_limit * 0.9)
+            else:
+                self.concurrency_limit = min(self.max_concurrency,
+                                             self.concurrency_limit + 1 / self.concurrency_limit)
+            self._condition.notify_all()
+
+    @staticmethod
+    def _check_deadline(deadline, wait_time=0):
+        if deadline is not None and time.monotonic() + wait_time >= deadline:
+            raise RateLimitTimeoutError(f'Запрос к API нельзя отправить раньше чем через {wait_time:.1f} с')
+
+    def _has_free_slot(self, priority):
+        if priority == BULK_PRIORITY and self.waiting_requests_numbers[INTERACTIVE_PRIORITY]:
+            return False
+        return self.in_flight_requests_number < int(self.concurrency_limit)
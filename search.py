@@ -0,0 +1,112 @@
+import re
+from collections import defaultdict
+
+WORD_PATTERN = re.compile(r'\w+')
+MIN_PREFIX_LENGTH = 2
+MIN_STEM_LENGTH = 3
+RESULTS_LIMIT = 20
+NAME_MATCH_SCORE = 2
+DESCRIPTION_MATCH_SCORE = 1
+MAX_INDEXES_NUMBER = 16
+# Окончания, которые отбрасываются у слов запроса, чтобы «сырами» и «пиццу» нашлись как «сыр» и «пицца»
+RUSSIAN_ENDINGS = sorted(
+    ['ами', 'ями', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'ой', 'ей', 'ый', 'ий', 'ая', 'яя', 'ое', 'ее', 'ые',
+     'ие', 'ов', 'ев', 'ам', 'ям', 'ах', 'ях', 'ом', 'ем', 'ую', 'юю', 'а', 'я', 'ы', 'и', 'у', 'ю', 'е', 'о'],
+    key=len,
+    reverse=True
+)
+
+_indexes = {}
+
+
+def normalize(text):
+    return text.lower().replace('ё', 'е')
+
+
+def tokenize(text):
+    return WORD_PATTERN.findall(normalize(text))
+
+
+def stem(word):
+    for ending in RUSSIAN_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM_LENGTH:
+            return word[:-len(ending)]
+    return word
+
+
+def get_prefixes(words):
+    for word in words:
+        for prefix_length in range(MIN_PREFIX_LENGTH, len(word) + 1):
+            yield word[:prefix_length]
+
+
+class ProductIndex:
+    """Префиксный индекс товаров по названию и описанию.
+
+    Слова товаров индексируются всеми префиксами от MIN_PREFIX_LENGTH букв, а у слов запроса
+    отбрасываются окончания, поэтому запрос находит товар по началу слова в любой форме.
+
+    Args:
+        products (list): товары каталога
+    """
+
+    def __init__(self, products):
+        self.products = {product.id: product for product in products}
+        self.products_by_name = {normalize(product.name.strip()): product for product in products}
+        self.name_prefixes = defaultdict(set)
+        self.description_prefixes = defaultdict(set)
+        for product in products:
+            for prefix in get_prefixes(tokenize(product.name)):
+                self.name_prefixes[prefix].add(product.id)
+            for prefix in get_prefixes(tokenize(product.description)):
+                self.description_prefixes[prefix].add(product.id)
+
+    def search(self, query):
+        """Ищет товары, в названии или описании которых есть все слова запроса.
+
+        Returns:
+            list: найденные товары, сначала совпавшие по названию
+        """
+        words = [stem(word) for word in tokenize(query) if len(word) >= MIN_PREFIX_LENGTH]
+        if not words:
+            return list(self.products.values())[:RESULTS_LIMIT]
+
+        scores = None
+        for word in words:
+            word_scores = {
+                product_id: DESCRIPTION_MATCH_SCORE for product_id in self.description_prefixes.get(word, ())
+            }
+            word_scores.update({product_id: NAME_MATCH_SCORE for product_id in self.name_prefixes.get(word, ())})
+            if scores is None:
+                scores = word_scores
+            else:
+                scores = {product_id: score + word_scores[product_id]
+                          for product_id, score in scores.items() if product_id in word_scores}
+            if not scores:
+                return []
+
+        found_products_ids = sorted(scores, key=lambda product_id: (-scores[product_id],
+                                                                    self.products[product_id].name))
+        return [self.products[product_id] for product_id in found_products_ids[:RESULTS_LIMIT]]
+
+    def get_by_name(self, name):
+        return self.products_by_name.get(normalize(name.strip()))
+
+
+def get_catalog_version(products):
+    return hash(tuple(products))
+
+
+def get_product_index(products):
+    """Возвращает индекс каталога, перестраивая его только при изменении каталога.
+
+    Индексы хранятся по версиям каталога, поэтому каталоги разных магазинов не вытесняют друг друга.
+    """
+    catalog_version = get_catalog_version(products)
+    index = _indexes.get(catalog_version)
+    if index is None:
+        if len(_indexes) >= MAX_INDEXES_NUMBER:
+            _indexes.clear()
+        index = ProductIndex(products)
+        _indexes[catalog_version] = index
+    return index
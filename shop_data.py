@@ -1,10 +1,12 @@
 import json
 import logging
+import os
 
 import requests
 import urllib3
 from dotenv import load_dotenv
 
+from database import get_database_connection, is_database_configured
 import online_shop
 
 logger = logging.getLogger(__name__)
@@ -103,18 +105,21 @@ def main():
 
     urllib3.disable_warnings()
     load_dotenv()
-
-    online_shop.get_access_token()
-    online_shop.set_headers()
+    if is_database_configured():
+        online_shop.share_rate_limits(get_database_connection())
 
     products_json_file_path = 'menu.json'
     pizzerias_addresses_json_file_path = 'addresses.json'
 
-    create_products(products_json_file_path)
+    with online_shop.use_store(os.getenv('STORE_NAME', online_shop.DEFAULT_STORE_NAME)), online_shop.bulk_priority():
+        online_shop.get_access_token()
+        online_shop.set_headers()
+
+        create_products(products_json_file_path)
 
-    create_pizzerias(pizzerias_addresses_json_file_path)
+        create_pizzerias(pizzerias_addresses_json_file_path)
 
-    create_customer_address_flow()
+        create_customer_address_flow()
 
 
 if __name__ == '__main__':
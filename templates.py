@@ -0,0 +1,77 @@
+from functools import lru_cache
+
+PRODUCT_CARD_TEMPLATE = '{name}\n{price}\n\n{description}\n'
+
+CART_ITEM_TEMPLATE = '{name}\n{description}\n{unit_price}\n'
+CART_ITEM_QUANTITY_TEMPLATE = '{quantity} шт. на сумму {value}\n\n'
+CART_TOTAL_TEMPLATE = 'К оплате: {total}\n'
+
+NEAR_PIZZERIA_TEMPLATE = (
+    'Может заберете пиццу из нашей пиццерии неподалеку?\n'
+    'Она всего в {distance} м от вас!\n'
+    'Вот ее адрес: {address}.\n'
+    '\n'
+    'А можем и бесплатно доставить.'
+)
+DELIVERY_TEMPLATE = (
+    'Можете забрать пиццу из нашей пиццерии бесплатно или заказать доставку.\n'
+    'Ближайшая пиццерия находится в {distance_km}км от вас!\n'
+    'Вот ее адрес: {address}\n'
+    '\n'
+    'Стоимость доставки: {delivery_cost} рублей.'
+)
+PICK_UP_ONLY_TEMPLATE = (
+    'Так далеко доставить пиццу не сможем. Доступен только самовывоз!\n'
+    'Ближайшая пиццерия находится в {distance_km} км от вас!\n'
+    'Вот ее адрес: {address}.'
+)
+
+STORE_UNAVAILABLE_TEXT = 'Магазин временно недоступен. Меню и корзина работают, оформить заказ можно будет чуть позже.'
+
+CART_CHANGES_LOST_TEXT = 'Не все изменения корзины удалось сохранить, пока магазин был недоступен. Проверьте её состав.'
+
+FEEDBACK_TEXT = (
+    'Приятного аппетита! *место для рекламы*\n'
+    '\n'
+    '*сообщение что делать если пицца не пришла*\n'
+)
+
+CACHED_FRAGMENTS_NUMBER = 1024
+
+
+def format_price(amount):
+    """Форматирует цену, хранящуюся в копейках."""
+    return f'{amount / 100:.2f} руб.'
+
+
+@lru_cache(maxsize=CACHED_FRAGMENTS_NUMBER)
+def render_product_card(product):
+    """Текст карточки товара.
+
+    Товар неизменяемый, поэтому кэш сам сбрасывается при смене названия, цены или описания в каталоге.
+    """
+    return PRODUCT_CARD_TEMPLATE.format(name=product.name, price=format_price(product.price),
+                                        description=product.description)
+
+
+@lru_cache(maxsize=CACHED_FRAGMENTS_NUMBER)
+def render_cart_item(name, description, unit_price):
+    return CART_ITEM_TEMPLATE.format(name=name, description=description, unit_price=format_price(unit_price))
+
+
+def render_cart(cart):
+    """Текст корзины: товары и сумма к оплате.
+
+    Args:
+        cart (:class:`models.Cart`): корзина
+
+    Returns:
+        str: текст корзины
+    """
+    fragments = []
+    for cart_item in cart.items:
+        fragments.append(render_cart_item(cart_item.name, cart_item.description, cart_item.unit_price))
+        fragments.append(CART_ITEM_QUANTITY_TEMPLATE.format(quantity=cart_item.quantity,
+                                                            value=format_price(cart_item.value)))
+    fragments.append(CART_TOTAL_TEMPLATE.format(total=format_price(cart.total)))
+    return ''.join(fragments)
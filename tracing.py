@@ -0,0 +1,97 @@
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+_settings = None
+_current_trace = threading.local()
+_file_lock = threading.Lock()
+_null_span = nullcontext()
+
+
+def configure(file_path, sample_rate=0.01, slow_threshold=1.0):
+    """Включает трассировку обработки апдейтов.
+
+    Трасса сохраняется, если апдейт попал в выборку с вероятностью sample_rate или обрабатывался
+    дольше slow_threshold секунд. Трассы дописываются в file_path в формате Chrome Trace Event
+    (JSON Array Format), файл открывается в chrome://tracing или ui.perfetto.dev.
+
+    Args:
+        file_path (str): путь к файлу трасс
+        sample_rate (float): доля апдейтов, трассы которых сохраняются всегда
+        slow_threshold (float): время обработки в секундах, после которого трасса сохраняется
+    """
+    global _settings
+    _settings = {'file_path': file_path, 'sample_rate': sample_rate, 'slow_threshold': slow_threshold}
+
+
+def configure_from_env():
+    """Включает трассировку, если задана переменная окружения TRACE_FILE."""
+    file_path = os.getenv('TRACE_FILE')
+    if file_path:
+        configure(file_path, float(os.getenv('TRACE_SAMPLE_RATE', 0.01)),
+                  float(os.getenv('TRACE_SLOW_THRESHOLD', 1.0)))
+
+
+def is_enabled():
+    return _settings is not None
+
+
+def trace(name, **args):
+    """Корневой спан апдейта. Без включённой трассировки ничего не делает."""
+    if _settings is None or getattr(_current_trace, 'events', None) is not None:
+        return _null_span
+    return _record_trace(name, args)
+
+
+def span(name, **args):
+    """Вложенный спан: запрос к магазину, Redis, геокодеру или Telegram внутри текущей трассы."""
+    events = getattr(_current_trace, 'events', None)
+    if events is None:
+        return _null_span
+    return _record_span(events, name, args)
+
+
+@contextmanager
+def _record_trace(name, args):
+    events = []
+    _current_trace.events = events
+    started_at = time.perf_counter()
+    try:
+        with _record_span(events, name, args):
+            yield
+    finally:
+        _current_trace.events = None
+        duration = time.perf_counter() - started_at
+        if duration >= _settings['slow_threshold'] or random.random() < _settings['sample_rate']:
+            _write_events(events)
+
+
+@contextmanager
+def _record_span(events, name, args):
+    started_at = time.time()
+    started_at_counter = time.perf_counter()
+    try:
+        yield
+    finally:
+        events.append({
+            'name': name,
+            'ph': 'X',
+            'ts': int(started_at * 1_000_000),
+            'dur': int((time.perf_counter() - started_at_counter) * 1_000_000),
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+            'args': args,
+        })
+
+
+def _write_events(events):
+    lines = ''.join(f'{json.dumps(event, ensure_ascii=False, default=str)},\n' for event in events)
+    with _file_lock:
+        with open(_settings['file_path'], 'a', encoding='utf-8') as trace_file:
+            # Закрывающая скобка не нужна: Chrome Trace Event допускает незакрытый массив
+            if trace_file.tell() == 0:
+                trace_file.write('[\n')
+            trace_file.write(lines)
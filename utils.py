@@ -1,9 +1,10 @@
 import logging
 
 import requests
-from geopy import distance
 
 import online_shop
+import tracing
+from templates import DELIVERY_TEMPLATE, NEAR_PIZZERIA_TEMPLATE, PICK_UP_ONLY_TEMPLATE
 
 logger = logging.getLogger(__name__)
 
@@ -12,7 +13,8 @@ def fetch_coordinates(apikey, place):
     logger.info(f'Получаем координаты {place} через геокодер')
     base_url = "https://geocode-maps.yandex.ru/1.x"
     params = {"geocode": place, "apikey": apikey, "format": "json"}
-    response = requests.get(base_url, params=params)
+    with tracing.span('geocoder', place=place):
+        response = requests.get(base_url, params=params)
     response.raise_for_status()
     found_places = response.json()['response']['GeoObjectCollection']['featureMember']
     if len(found_places) == 0:
@@ -23,56 +25,33 @@ def fetch_coordinates(apikey, place):
 
 
 def get_nearest_pizzeria(current_position, pizzerias):
-    pizzerias_distances = []
-    for pizzeria in pizzerias:
-        pizzeria_distance = distance.distance(
-            (pizzeria['Latitude'], pizzeria['Longitude']),
-            current_position
-        ).m
-        pizzerias_distances.append(
-            {
-                'pizzeria': pizzeria,
-                'distance': int(pizzeria_distance)
-            }
-        )
-    nearest_pizzeria = min(pizzerias_distances, key=lambda x: x['distance'])
-    logger.info(f'Нашли ближайшую пиццерию{nearest_pizzeria}')
-    return nearest_pizzeria
+    # geopy нужен только при оформлении заказа, поэтому не замедляет запуск бота
+    from geopy import distance
 
+    pizzerias_distances = [
+        (pizzeria, int(distance.distance(pizzeria.position, current_position).m))
+        for pizzeria in pizzerias
+    ]
+    nearest_pizzeria, nearest_pizzeria_distance = min(pizzerias_distances, key=lambda x: x[1])
+    logger.info(f'Нашли ближайшую пиццерию {nearest_pizzeria} на расстоянии {nearest_pizzeria_distance} м')
+    return nearest_pizzeria, nearest_pizzeria_distance
 
-def get_delivery_cost_and_message_text(nearest_pizzeria):
-    nearest_pizzeria_distance = nearest_pizzeria['distance']
-    nearest_pizzeria_distance_km = round(nearest_pizzeria_distance / 1000, 1)
-    nearest_pizzeria_address = nearest_pizzeria['pizzeria']['Address']
 
-    message_text_template = '''\
-        Можете забрать пиццу из нашей пиццерии бесплатно или заказать доставку. 
-        Ближайшая пиццерия находится в {}км от вас! 
-        Вот ее адрес: {} 
-        
-        Стоимость доставки: {} рублей.'''
+def get_delivery_cost_and_message_text(nearest_pizzeria, nearest_pizzeria_distance):
+    nearest_pizzeria_distance_km = round(nearest_pizzeria_distance / 1000, 1)
+    nearest_pizzeria_address = nearest_pizzeria.address
 
     delivery_cost = 0
     if nearest_pizzeria_distance < 500:
-        message_text = f'''\
-        Может заберете пиццу из нашей пиццерии неподалеку? 
-        Она всего в {nearest_pizzeria_distance} м от вас! 
-        Вот ее адрес: {nearest_pizzeria_address}.
-
-        А можем и бесплатно доставить.'''
+        message_text = NEAR_PIZZERIA_TEMPLATE.format(distance=nearest_pizzeria_distance,
+                                                     address=nearest_pizzeria_address)
     elif nearest_pizzeria_distance > 20000:
-        message_text = f'''\
-        Так далеко доставить пиццу не сможем. Доступен только самовывоз!
-        Ближайшая пиццерия находится в {round(nearest_pizzeria_distance / 1000, 1)} км от вас!
-        Вот ее адрес: {nearest_pizzeria_address}.'''
-    elif nearest_pizzeria_distance < 5000:
-        delivery_cost = 100
-        message_text = message_text_template.format(nearest_pizzeria_distance_km,
-                                                    nearest_pizzeria_address, delivery_cost)
-    elif nearest_pizzeria_distance < 20000:
-        delivery_cost = 300
-        message_text = message_text_template.format(nearest_pizzeria_distance_km,
-                                                    nearest_pizzeria_address, delivery_cost)
+        message_text = PICK_UP_ONLY_TEMPLATE.format(distance_km=nearest_pizzeria_distance_km,
+                                                    address=nearest_pizzeria_address)
+    else:
+        delivery_cost = 100 if nearest_pizzeria_distance < 5000 else 300
+        message_text = DELIVERY_TEMPLATE.format(distance_km=nearest_pizzeria_distance_km,
+                                                address=nearest_pizzeria_address, delivery_cost=delivery_cost)
     return delivery_cost, message_text
 
 